@@ -1,25 +1,70 @@
 # Import modules
+import hmac
 import json
+import os
+import time
+import uuid
 from io import BytesIO
+from typing import Optional
 
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, Response, jsonify, request, send_file
 from flask_cors import CORS
 from flask_restful import Api, Resource
 
 from flask_session import Session
-from pdfgen import CheatsheetGenerator
+from batch import generate_batch, write_zip
+from jobs import JobQueue, JobStatus
+from pdfcache import PDFCache, sheet_key
+from metrics import MetricsRegistry
+from packing import PackingStrategy
+from pdfgen import CheatsheetGenerator, cache_stats, plan_to_json
+from profiling import ProfileMode, profile_sheet
 
 # Init app
 app = Flask(__name__)
 
 # Browser caching
 app.config['SESSION_TYPE'] = 'filesystem'
+app.config['SESSION_FILE_DIR'] = os.path.join(os.getcwd(), 'flask_session')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB
 
+# Generated PDF cache
+app.config['PDF_CACHE_MAX_ENTRIES'] = 64
+app.config['PDF_CACHE_MAX_BYTES'] = 64 * 1024 * 1024  # 64 MB
+app.config['PDF_CACHE_DISK'] = False  # also keep PDFs next to the session files
+
+# Background generation jobs
+app.config['JOB_WORKERS'] = 2
+app.config['JOB_MAX_PENDING'] = 16
+app.config['JOB_TTL'] = 10 * 60  # seconds
+app.config['JOB_MAX_FINISHED'] = 32  # finished jobs whose results are kept
+
+# Batch generation
+app.config['BATCH_WORKERS'] = 4
+app.config['BATCH_MAX_SHEETS'] = 32
+
+# Profiling with meta_profile, allowed for requests with this X-Profile-Token
+app.config['PROFILE_TOKEN'] = os.environ.get('NED_PROFILE_TOKEN')
+app.config['PROFILE_DIR'] = None  # also keep profile bundles here
+
 CORS(app)
 Session(app)
 api = Api(app)
 
+pdf_cache = PDFCache(
+    max_entries=app.config['PDF_CACHE_MAX_ENTRIES'],
+    max_bytes=app.config['PDF_CACHE_MAX_BYTES'],
+    directory=os.path.join(app.config['SESSION_FILE_DIR'], 'pdf_cache')
+    if app.config['PDF_CACHE_DISK'] else None,
+)
+metrics = MetricsRegistry()
+job_queue = JobQueue(
+    workers=app.config['JOB_WORKERS'],
+    max_pending=app.config['JOB_MAX_PENDING'],
+    ttl=app.config['JOB_TTL'],
+    max_finished=app.config['JOB_MAX_FINISHED'],
+)
+
 
 class Ping(Resource):
 
@@ -27,33 +72,250 @@ class Ping(Resource):
         return jsonify({'message': "Pong!"})
 
 
+def parse_sheet_request():
+    """Collect topics and generator options from a sheet submission form."""
+    topics = []
+    meta = {}
+    for key, value in request.form.items():
+        if key.startswith('data_'):
+            topics.append(json.loads(value))
+        elif key.startswith('meta_'):
+            meta[key[5:]] = json.loads(value)
+
+    # Process files
+    for file in request.files.values():
+        topics.append({'media': 'image', 'file': BytesIO(file.read())})
+
+    return topics, meta
+
+
+def meta_error(meta) -> Optional[str]:
+    """Why the generator options of a submission are invalid, or None if they are valid."""
+    packing = meta.get('packing')
+    strategies = [strategy.value for strategy in PackingStrategy]
+    if packing is not None and packing not in strategies:
+        return (f"Unknown packing strategy {packing!r}, expected one of: "
+                f"{', '.join(strategies)}.")
+    return None
+
+
+def record_metrics(cg: CheatsheetGenerator, key: str, seconds: float):
+    """Add a finished generator's metrics to /metrics and log them as one line."""
+    sheet_metrics = cg.metrics()
+    metrics.observe(sheet_metrics, seconds)
+    print("Sheet metrics: " +
+          json.dumps({
+              'sheet': key[:16],
+              'seconds': seconds,
+              **sheet_metrics
+          }))
+    return sheet_metrics
+
+
+def metrics_headers(sheet_metrics) -> dict:
+    """Per-request metrics as response headers."""
+    timing = ', '.join(f'{stage};dur={seconds * 1000:.1f}'
+                       for stage, seconds in sheet_metrics['timings'].items())
+    counters = {k: v for k, v in sheet_metrics.items() if k != 'timings'}
+    return {'Server-Timing': timing, 'X-Sheet-Metrics': json.dumps(counters)}
+
+
+def generate_pdf(topics, meta, progress=None, sheet_metrics=None) -> bytes:
+    """
+    Generate a sheet's PDF, serving identical submissions from the cache. If the sheet is
+    generated, its metrics are added to the `sheet_metrics` dict when one is given.
+    """
+    key = sheet_key(topics, meta)
+    pdf = pdf_cache.get(key)
+    if pdf is None:
+        start = time.perf_counter()
+        # A plan previewed through /layout is rendered as is
+        options = dict(meta)
+        plan = options.pop('plan', None)
+        cg = CheatsheetGenerator(topics, progress=progress, **options)
+        pdf = cg.create_pdf(plan=plan).getvalue()
+        pdf_cache.put(key, pdf)
+        generated = record_metrics(cg, key, time.perf_counter() - start)
+        if sheet_metrics is not None:
+            sheet_metrics.update(generated)
+    return pdf
+
+
+def profiling_allowed() -> bool:
+    token = app.config['PROFILE_TOKEN']
+    given = request.headers.get('X-Profile-Token', '')
+    return bool(token) and hmac.compare_digest(given, token)
+
+
 class CreatePDF(Resource):
 
     def post(self):
-        topics = []
-        meta = {}
-        for key, value in request.form.items():
-            if key.startswith('data_'):
-                topics.append(json.loads(value))
-            elif key.startswith('meta_'):
-                meta[key[5:]] = json.loads(value)
+        topics, meta = parse_sheet_request()
+        error = meta_error(meta)
+        if error:
+            return {'message': error}, 400
 
-        # Process files
-        for file in request.files.values():
-            topics.append({'media': 'image', 'file': BytesIO(file.read())})
+        # Return a profile bundle with the input and PDF instead of the PDF
+        profile = meta.pop('profile', None)
+        if profile:
+            if not profiling_allowed():
+                return {'message': "Profiling is not allowed."}, 403
+            modes = [mode.value for mode in ProfileMode]
+            if profile is not True and profile not in modes:
+                return {
+                    'message': f"Unknown profile mode {profile!r}, expected "
+                               f"one of: {', '.join(modes)}."
+                }, 400
+            mode = ProfileMode.CPROFILE if profile is True else ProfileMode(
+                profile)
+            bundle = profile_sheet(topics, meta, mode)
+            if app.config['PROFILE_DIR']:
+                os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+                path = os.path.join(app.config['PROFILE_DIR'],
+                                    f'{uuid.uuid4().hex}.zip')
+                with open(path, 'wb') as f:
+                    f.write(bundle)
+            return send_file(BytesIO(bundle),
+                             mimetype='application/zip',
+                             as_attachment=True,
+                             download_name="profile.zip")
 
-        cg = CheatsheetGenerator(topics, **meta)
-        buf = cg.create_pdf()
+        sheet_metrics = {}
+        pdf = generate_pdf(topics, meta, sheet_metrics=sheet_metrics)
         #buf = open('example/dummy.pdf', 'rb')
 
+        response = send_file(BytesIO(pdf),
+                             mimetype='application/pdf',
+                             as_attachment=False,
+                             download_name="generated.pdf")
+        if sheet_metrics:
+            response.headers.update(metrics_headers(sheet_metrics))
+        return response
+
+
+class Layout(Resource):
+
+    def post(self):
+        topics, meta = parse_sheet_request()
+        error = meta_error(meta)
+        if error:
+            return {'message': error}, 400
+
+        # Page-count bounds at the requested font size, to warn before generating
+        if meta.pop('estimate', False):
+            return CheatsheetGenerator(topics, **meta).estimate()
+
+        start = time.perf_counter()
+        cg = CheatsheetGenerator(topics, **meta)
+        response = jsonify(plan_to_json(cg.layout()))
+        sheet_metrics = record_metrics(cg, sheet_key(topics, meta),
+                                       time.perf_counter() - start)
+        response.headers.update(metrics_headers(sheet_metrics))
+        return response
+
+
+class Batch(Resource):
+
+    def post(self):
+        """
+        Generate several sheets and return them as a ZIP with a manifest.json. The form has a
+        `sheets` JSON list of {name, topics, meta}; images for sheet i are uploaded as files
+        under the field `sheet_<i>`.
+        """
+        sheets = json.loads(request.form.get('sheets', '[]'))
+        if not sheets:
+            return {'message': "No sheets given."}, 400
+        if len(sheets) > app.config['BATCH_MAX_SHEETS']:
+            return {
+                'message':
+                    f"At most {app.config['BATCH_MAX_SHEETS']} sheets per batch."
+            }, 413
+
+        # Process files
+        for i, sheet in enumerate(sheets):
+            for file in request.files.getlist(f'sheet_{i}'):
+                sheet.setdefault('topics', []).append({
+                    'media': 'image',
+                    'file': BytesIO(file.read())
+                })
+
+        buf = BytesIO()
+        write_zip(
+            generate_batch(sheets,
+                           workers=app.config['BATCH_WORKERS'],
+                           generate=generate_pdf), buf)
+        buf.seek(0)
         return send_file(buf,
+                         mimetype='application/zip',
+                         as_attachment=True,
+                         download_name="cheatsheets.zip")
+
+
+class SubmitJob(Resource):
+
+    def post(self):
+        topics, meta = parse_sheet_request()
+        error = meta_error(meta)
+        if error:
+            return {'message': error}, 400
+
+        job_id = job_queue.submit(
+            lambda progress: generate_pdf(topics, meta, progress))
+        if job_id is None:
+            return {'message': "Too many pending jobs, try again later."}, 429
+        return {'job_id': job_id}, 202
+
+
+class JobStatusResource(Resource):
+
+    def get(self, job_id):
+        status = job_queue.status(job_id)
+        if status is None:
+            return {'message': "Unknown or expired job."}, 404
+        return status
+
+
+class JobResult(Resource):
+
+    def get(self, job_id):
+        status = job_queue.status(job_id)
+        if status is None:
+            return {'message': "Unknown or expired job."}, 404
+        if status['status'] == JobStatus.FAILED.value:
+            return {'message': "Job failed.", **status}, 500
+        if status['status'] != JobStatus.DONE.value:
+            return {'message': "Job has not finished.", **status}, 409
+
+        return send_file(BytesIO(job_queue.result(job_id)),
                          mimetype='application/pdf',
                          as_attachment=False,
                          download_name="generated.pdf")
 
 
+class Metrics(Resource):
+
+    def get(self):
+        extra = []
+        caches = {'pdf': pdf_cache.stats(), **cache_stats()}
+        for cache, stats in caches.items():
+            for key in ('hits', 'misses'):
+                extra.append((f'{cache}_cache_{key}_total', 'counter',
+                              f"{key.capitalize()} of the {cache} cache.",
+                              stats[key]))
+            extra.append((f'{cache}_cache_entries', 'gauge',
+                          f"Entries in the {cache} cache.", stats['entries']))
+        return Response(metrics.render(extra),
+                        mimetype='text/plain; version=0.0.4')
+
+
 api.add_resource(Ping, "/ping")
+api.add_resource(Metrics, "/metrics")
 api.add_resource(CreatePDF, "/createpdf")
+api.add_resource(Layout, "/layout")
+api.add_resource(Batch, "/batch")
+api.add_resource(SubmitJob, "/jobs")
+api.add_resource(JobStatusResource, "/jobs/<job_id>")
+api.add_resource(JobResult, "/jobs/<job_id>/result")
 
 # Driver
 if __name__ == '__main__':
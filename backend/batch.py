@@ -0,0 +1,126 @@
+"""
+Generation of many cheatsheets in one call. Sheets are generated concurrently on threads
+of this process, so they share the font metrics, wrap and image caches.
+
+Usage: python batch.py SHEET.json [SHEET.json ...] -o sheets.zip
+"""
+import argparse
+import io
+import json
+import os
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional
+
+from pdfgen import CheatsheetGenerator, Topic
+
+DEFAULT_WORKERS = 4
+MANIFEST_NAME = 'manifest.json'
+
+SheetSpec = Dict[str, Any]  # name, topics and generator options ('meta') of one sheet
+SheetResult = Dict[str, Any]
+Generate = Callable[[List[Topic], Dict[str, Any]], bytes]
+
+
+def _generate(topics: List[Topic], meta: Dict[str, Any]) -> bytes:
+    return CheatsheetGenerator(topics, **meta).create_pdf().getvalue()
+
+
+def generate_batch(
+    sheets: List[SheetSpec],
+    workers: int = DEFAULT_WORKERS,
+    generate: Generate = _generate,
+) -> Iterator[SheetResult]:
+    """
+    Generate every sheet on a pool of `workers` threads, yielding results as they finish.
+    Each result has the sheet's index and name, and either its PDF bytes under 'pdf' or
+    the reason it failed under 'error'. A failing sheet does not stop the others.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(generate, sheet.get('topics', []),
+                            sheet.get('meta', {})): i
+            for i, sheet in enumerate(sheets)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            result = {'index': i, 'name': sheets[i].get('name', f'sheet{i}')}
+            try:
+                result['pdf'] = future.result()
+            except Exception as e:
+                print(f"Error generating sheet {result['name']}: {e}")
+                result['error'] = str(e)
+            yield result
+
+
+def write_zip(results: Iterator[SheetResult], output: BinaryIO) -> None:
+    """
+    Write generated sheets to a ZIP archive as <index>-<name>.pdf, plus a manifest listing
+    every sheet with its file name or error.
+    """
+    manifest = []
+    with zipfile.ZipFile(output, 'w') as archive:
+        for result in results:
+            entry = {'index': result['index'], 'name': result['name']}
+            if 'error' in result:
+                entry['error'] = result['error']
+            else:
+                name = re.sub(r'[^\w.-]+', '_', result['name'])
+                entry['file'] = f"{result['index']:03}-{name}.pdf"
+                # PDF streams are already compressed
+                archive.writestr(entry['file'], result['pdf'],
+                                 zipfile.ZIP_STORED)
+            manifest.append(entry)
+
+        manifest.sort(key=lambda entry: entry['index'])
+        archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2),
+                         zipfile.ZIP_DEFLATED)
+
+
+def load_sheet(path: str) -> SheetSpec:
+    """
+    Read a sheet spec from a JSON file: a list of topics, or an object with 'topics' and
+    optional 'meta' generator options. Image topics give a 'path' relative to the file.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    if isinstance(spec, list):
+        spec = {'topics': spec}
+
+    base = os.path.dirname(path)
+    for topic in spec['topics']:
+        if topic.get('media') == 'image':
+            with open(os.path.join(base, topic.pop('path')), 'rb') as img:
+                topic['file'] = io.BytesIO(img.read())
+
+    spec.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    return spec
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate many cheatsheets.")
+    parser.add_argument('sheets', nargs='+', help="sheet spec JSON files")
+    parser.add_argument('-o', '--output', default='sheets.zip')
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args(argv)
+
+    failed = 0
+    with open(args.output, 'wb') as f:
+
+        def counted(results: Iterator[SheetResult]) -> Iterator[SheetResult]:
+            nonlocal failed
+            for result in results:
+                failed += 'error' in result
+                yield result
+
+        sheets = [load_sheet(path) for path in args.sheets]
+        write_zip(counted(generate_batch(sheets, args.workers)), f)
+
+    print(f"Wrote {len(args.sheets) - failed} of {len(args.sheets)} sheets to "
+          f"{args.output}.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,275 @@
+"""
+Benchmarks for the PDF generation pipeline on synthetic sheets and the bundled example.
+Every case is generated `--repeat` times from cold caches, timing each generator stage.
+Results are written as JSON and can be compared against an earlier run.
+
+Usage: python benchmark.py [-o results.json] [--baseline old.json] [--topics 20 80 ...]
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import math
+import platform
+import random
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw
+
+import imaging
+import pdfgen
+import styledtext
+from pdfgen import STAGES, CheatsheetGenerator, Topic
+
+EXAMPLE_PATH = 'example/neil_cheatsheet.txt'
+DEFAULT_REPEAT = 5
+REGRESSION_THRESHOLD = 0.1  # slowdown of a case's p50 latency reported as a regression
+
+Case = Dict[str, Any]
+Result = Dict[str, Any]
+
+WORDS = ('the', 'of', 'a', 'set', 'graph', 'vertex', 'edge', 'theorem', 'proof',
+         'lemma', 'for', 'all', 'f(x)', 'O(n log n)', 'Θ(n)', 'x^{2}', 'a_{i}',
+         'e^{iπ}', 'log_{2}', 'well-known', 'non-deterministic', 'polynomial',
+         'reduction', 'algorithm', '∑', '≤', '→', '--')
+
+
+def synthetic_corpus(topics: int,
+                     bullet_length: int,
+                     images: int = 0,
+                     bullets: int = 5,
+                     seed: int = 0) -> List[Topic]:
+    """
+    Random topics of `bullets` bullets of about `bullet_length` characters, with style
+    markup and unicode, followed by `images` line-drawing images.
+    """
+    rng = random.Random(seed)
+
+    def sentence(length: int) -> str:
+        words = []
+        while sum(map(len, words)) + len(words) < length:
+            words.append(rng.choice(WORDS))
+        return ' '.join(words)
+
+    corpus = [{
+        'media': 'text',
+        'topic': sentence(rng.randint(5, 30)),
+        'content': [
+            sentence(rng.randint(bullet_length // 2, bullet_length * 3 // 2))
+            for _ in range(rng.randint(1, 2 * bullets - 1))
+        ],
+        'nowrap': False,
+    } for _ in range(topics)]
+
+    for _ in range(images):
+        img = Image.new('RGB', (rng.randint(400, 1600), rng.randint(300, 1200)),
+                        'white')
+        draw = ImageDraw.Draw(img)
+        for _ in range(40):
+            draw.line([(rng.randrange(img.width), rng.randrange(img.height))
+                       for _ in range(2)],
+                      fill=(0, 0, 0),
+                      width=3)
+        buf = io.BytesIO()
+        img.save(buf, format='PNG')
+        corpus.append({'media': 'image', 'file': buf})
+
+    return corpus
+
+
+def example_corpus(path: str = EXAMPLE_PATH) -> List[Topic]:
+    """Topics of an example cheatsheet: a title line, then bullets, blank line separated."""
+    corpus = []
+    topic = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                if topic is not None:
+                    corpus.append(topic)
+                topic = None
+            elif topic is None:
+                topic = {'media': 'text', 'topic': line.strip(), 'content': []}
+            else:
+                topic['content'].append(line)
+    if topic is not None:
+        corpus.append(topic)
+    return corpus
+
+
+def _copy_topics(topics: List[Topic]) -> List[Topic]:
+    return [
+        dict(t, file=io.BytesIO(t['file'].getvalue())) if 'file' in t else t
+        for t in topics
+    ]
+
+
+def _clear_caches() -> None:
+    pdfgen._wrap_cache.clear()
+    imaging._image_cache.clear()
+    styledtext.parse_style.cache_clear()
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    return {
+        'p50': _percentile(values, 50),
+        'p95': _percentile(values, 95),
+        'mean': sum(values) / len(values),
+    }
+
+
+def _generate(topics: List[Topic],
+              max_pages: Optional[int]) -> Tuple[CheatsheetGenerator, Dict, int]:
+    """Generate a sheet quietly, returning the generator, its plan and the PDF size."""
+    gen = CheatsheetGenerator(_copy_topics(topics), max_pages=max_pages)
+    with contextlib.redirect_stdout(io.StringIO()):
+        plan = gen.layout()
+    return gen, plan, len(gen.render(plan).getvalue())
+
+
+def run_case(case: Case, repeat: int = DEFAULT_REPEAT) -> Result:
+    """Generate a case `repeat` times from cold caches, then once more to trace memory."""
+    topics = case['topics']
+    latencies = []
+    stages = {stage: [] for stage in STAGES}
+    for _ in range(repeat):
+        _clear_caches()
+        start = time.perf_counter()
+        gen, plan, size = _generate(topics, case['max_pages'])
+        latencies.append(time.perf_counter() - start)
+        for stage in STAGES:
+            stages[stage].append(gen.timings[stage])
+
+    # Tracing slows allocation down, so memory gets a run of its own
+    _clear_caches()
+    tracemalloc.start()
+    try:
+        _generate(topics, case['max_pages'])
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'name': case['name'],
+        'params': case['params'],
+        'topics': len(topics),
+        'pages': plan['pages'],
+        'font_size': plan['font_size'],
+        'attempts': gen.attempts,
+        'output_bytes': size,
+        'latency': _summary(latencies),
+        'stages': {stage: _summary(times) for stage, times in stages.items()},
+        'sheets_per_second': repeat / sum(latencies),
+        'topics_per_second': repeat * len(topics) / sum(latencies),
+        'peak_memory_bytes': peak,
+    }
+
+
+def build_cases(args: argparse.Namespace) -> List[Case]:
+    cases = []
+    if not args.no_example:
+        for max_pages in args.max_pages:
+            cases.append({
+                'name': f"example max_pages={max_pages or None}",
+                'params': {'corpus': EXAMPLE_PATH, 'max_pages': max_pages or None},
+                'topics': example_corpus(),
+                'max_pages': max_pages or None,
+            })
+
+    for topics, length, images, max_pages in itertools.product(
+            args.topics, args.bullet_length, args.images, args.max_pages):
+        params = {
+            'topics': topics,
+            'bullet_length': length,
+            'images': images,
+            'max_pages': max_pages or None,
+        }
+        cases.append({
+            'name': ' '.join(f"{k}={v}" for k, v in params.items()),
+            'params': params,
+            'topics': synthetic_corpus(topics, length, images, seed=args.seed),
+            'max_pages': max_pages or None,
+        })
+    return cases
+
+
+def compare(results: List[Result], baseline: List[Result],
+            threshold: float = REGRESSION_THRESHOLD) -> int:
+    """Print p50 changes against a baseline run and return the number of regressions."""
+    previous = {r['name']: r for r in baseline}
+    regressions = 0
+    for result in results:
+        old = previous.get(result['name'])
+        if old is None:
+            continue
+        ratio = result['latency']['p50'] / old['latency']['p50']
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions += 1
+            flag = '  REGRESSION'
+        stages = ', '.join(
+            f"{stage} {result['stages'][stage]['p50'] / old['stages'][stage]['p50']:.2f}x"
+            for stage in STAGES if old['stages'][stage]['p50'] > 0)
+        print(f"{result['name']}: {ratio:.2f}x ({stages}){flag}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark cheatsheet generation.")
+    parser.add_argument('-o', '--output', default='benchmark.json')
+    parser.add_argument('--baseline', help="earlier results to compare with")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--topics', type=int, nargs='+', default=[20, 80])
+    parser.add_argument('--bullet-length', type=int, nargs='+', default=[60])
+    parser.add_argument('--images', type=int, nargs='+', default=[0, 4])
+    parser.add_argument('--max-pages',
+                        type=int,
+                        nargs='+',
+                        default=[0, 2],
+                        help="page limits to try, 0 for none")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-example', action='store_true',
+                        help="skip the bundled example sheet")
+    args = parser.parse_args(argv)
+
+    results = []
+    for case in build_cases(args):
+        result = run_case(case, args.repeat)
+        results.append(result)
+        stages = ' '.join(f"{stage} {result['stages'][stage]['p50'] * 1000:.0f}"
+                          for stage in STAGES)
+        print(f"{result['name']}: p50 {result['latency']['p50'] * 1000:.0f} ms, "
+              f"p95 {result['latency']['p95'] * 1000:.0f} ms ({stages}), "
+              f"{result['pages']} pages, "
+              f"peak {result['peak_memory_bytes'] / 2**20:.1f} MiB")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(
+            {
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'repeat': args.repeat,
+                'results': results,
+            },
+            f,
+            indent=2)
+    print(f"Wrote results to {args.output}.")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        return 1 if compare(results, baseline) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,96 @@
+"""
+Glyph-advance tables for registered TTF fonts, used to measure text without going through
+a ReportLab canvas. Widths are identical to `canvas.stringWidth` for the same font and size.
+"""
+from functools import lru_cache
+from itertools import accumulate, repeat
+from typing import Dict, Iterable, List
+
+from reportlab.pdfbase import pdfmetrics
+
+ADVANCE_CACHE_SIZE = 1 << 16  # max memoized string advances per font
+
+
+class FontMetrics:
+    """
+    Advance-width table for a single registered font. Advances are kept in unscaled
+    1/1000 em units and scaled linearly by font size on request.
+    """
+
+    def __init__(self, font_name: str):
+        face = pdfmetrics.getFont(font_name).face
+        self.font_name = font_name
+        self._char_widths: Dict[int, float] = dict(face.charWidths)
+        self._default_width: float = face.defaultWidth
+        self._advances: Dict[str, float] = {}
+
+    def _char_advances(self, text: str) -> Iterable[float]:
+        return map(self._char_widths.get, map(ord, text),
+                   repeat(self._default_width))
+
+    def advance(self, text: str) -> float:
+        """Unscaled advance of `text` in 1/1000 em units."""
+        try:
+            return self._advances[text]
+        except KeyError:
+            pass
+
+        adv = sum(self._char_advances(text))
+        if len(self._advances) >= ADVANCE_CACHE_SIZE:
+            self._advances.clear()
+        self._advances[text] = adv
+        return adv
+
+    def string_width(self, text: str, font_size: float) -> float:
+        """Width of `text` in points at `font_size`."""
+        return 0.001 * font_size * self.advance(text)
+
+    def prefix_widths(self, text: str, font_size: float) -> List[float]:
+        """
+        Widths of every prefix of `text` in one pass, such that
+        `prefix_widths(text, size)[i] == string_width(text[:i], size)`.
+        """
+        scale = 0.001 * font_size
+        return [
+            scale * a
+            for a in accumulate(self._char_advances(text), initial=0)
+        ]
+
+    def chunk_widths(self, chunks: Iterable[str],
+                     font_size: float) -> List[float]:
+        """Widths of each string in `chunks` at `font_size`."""
+        scale = 0.001 * font_size
+        return [scale * self.advance(c) for c in chunks]
+
+
+@lru_cache(maxsize=None)
+def get_metrics(font_name: str) -> FontMetrics:
+    """Return the shared advance table for a registered font, building it on first use."""
+    return FontMetrics(font_name)
+
+
+class TextMeasurer:
+    """
+    Measurement service backed by the shared advance tables. Exposes the same
+    `stringWidth` signature as a ReportLab canvas so it can be used in its place.
+    Counts the strings it measures: one per `stringWidth` call, per prefix measured
+    by `prefix_widths` and per chunk measured by `chunk_widths`.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def stringWidth(self, text: str, fontName: str, fontSize: float) -> float:
+        self.calls += 1
+        return get_metrics(fontName).string_width(text, fontSize)
+
+    def prefix_widths(self, text: str, font_name: str,
+                      font_size: float) -> List[float]:
+        self.calls += len(text) + 1
+        return get_metrics(font_name).prefix_widths(text, font_size)
+
+    def chunk_widths(self, chunks: Iterable[str], font_name: str,
+                     font_size: float) -> List[float]:
+        widths = get_metrics(font_name).chunk_widths(chunks, font_size)
+        self.calls += len(widths)
+        return widths
@@ -0,0 +1,70 @@
+"""
+Resampling and re-encoding of uploaded images to the resolution they are placed at.
+"""
+import hashlib
+import io
+import math
+from typing import Union
+
+from PIL import Image
+from reportlab.lib.units import inch
+
+from lru import LRUCache
+
+IMAGE_DPI = 300  # target resolution of placed images
+JPEG_QUALITY = 85
+IMAGE_CACHE_SIZE = 64  # prepared images memoized across requests
+MIN_DOWNSCALE = 1.5  # only resample images at least this many times too large
+
+# Prepared image (JPEG bytes or resampled PIL image) keyed on
+# (content hash, placed size, dpi, quality)
+_image_cache = LRUCache(IMAGE_CACHE_SIZE)
+
+
+def prepare_image(
+    data: bytes,
+    width: float,
+    height: float,
+    dpi: int = IMAGE_DPI,
+    quality: int = JPEG_QUALITY,
+) -> Union[Image.Image, io.BytesIO]:
+    """
+    Downscale an image to `dpi` at its placed size of `width` x `height` points. JPEGs are
+    re-encoded at `quality` and returned as a buffer, which ReportLab embeds as-is; other
+    formats are returned as a PIL image for ReportLab to Flate-compress. Images are never
+    upscaled, and images less than MIN_DOWNSCALE times too large are kept as they are,
+    since resampling line art makes it compress worse.
+    """
+    key = (hashlib.sha256(data).hexdigest(), width, height, dpi, quality)
+    prepared = _image_cache.get(key)
+    if prepared is None:
+        prepared = _resample(data, width, height, dpi, quality)
+        _image_cache.put(key, prepared)
+
+    if isinstance(prepared, bytes):
+        return io.BytesIO(prepared)
+    return prepared
+
+
+def _resample(data: bytes, width: float, height: float, dpi: int,
+              quality: int) -> Union[Image.Image, bytes]:
+    img = Image.open(io.BytesIO(data))
+    is_jpeg = img.format == 'JPEG'
+
+    size = (math.ceil(width / inch * dpi), math.ceil(height / inch * dpi))
+    scale = max(img.width / size[0], img.height / size[1])
+    if scale < MIN_DOWNSCALE:
+        if is_jpeg:
+            return data
+        img.load()
+        return img
+
+    img = img.resize(size, Image.LANCZOS)
+    if not is_jpeg:
+        return img
+
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=quality, optimize=True)
+    return buf.getvalue()
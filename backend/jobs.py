@@ -0,0 +1,122 @@
+"""
+Background PDF generation jobs with progress reporting, bounded concurrency and result expiry.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_PENDING = 16  # queued + running jobs before submissions are refused
+DEFAULT_TTL = 10 * 60  # seconds a finished job is kept
+DEFAULT_MAX_FINISHED = 32  # finished jobs kept, the oldest are dropped first
+
+Job = Dict[str, Any]
+ProgressCallback = Callable[[int, float], None]
+
+
+class JobStatus(Enum):
+    """Lifecycle of a generation job"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class JobQueue:
+    """
+    Runs generation tasks on a bounded thread pool. A task is called with a progress
+    callback taking (attempt, font size) and returns the PDF bytes.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        ttl: float = DEFAULT_TTL,
+        max_finished: int = DEFAULT_MAX_FINISHED,
+    ):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def _expire(self) -> None:
+        """
+        Drop finished jobs older than the TTL, and the oldest finished jobs beyond
+        max_finished. Caller holds the lock.
+        """
+        now = time.monotonic()
+        finished = sorted((job['finished'], job_id)
+                          for job_id, job in self._jobs.items()
+                          if job['finished'] is not None)
+        excess = len(finished) - self.max_finished
+        for i, (when, job_id) in enumerate(finished):
+            if i < excess or now - when > self.ttl:
+                del self._jobs[job_id]
+
+    def _run(self, job: Job, task: Callable[[ProgressCallback], bytes]):
+
+        def progress(attempt: int, font_size: float) -> None:
+            job['attempt'] = attempt
+            job['font_size'] = font_size
+
+        job['status'] = JobStatus.RUNNING
+        try:
+            job['result'] = task(progress)
+            job['status'] = JobStatus.DONE
+        except Exception as e:
+            job['error'] = str(e)
+            job['status'] = JobStatus.FAILED
+        finally:
+            with self._lock:
+                job['finished'] = time.monotonic()
+                self._expire()
+
+    def submit(self,
+               task: Callable[[ProgressCallback], bytes]) -> Optional[str]:
+        """Queue a task and return its job id, or None if the queue is full."""
+        with self._lock:
+            self._expire()
+            pending = sum(1 for job in self._jobs.values()
+                          if job['finished'] is None)
+            if pending >= self.max_pending:
+                return None
+
+            job_id = uuid.uuid4().hex
+            job = self._jobs[job_id] = {
+                'status': JobStatus.QUEUED,
+                'attempt': 0,
+                'font_size': None,
+                'result': None,
+                'error': None,
+                'finished': None,
+            }
+
+        self._executor.submit(self._run, job, task)
+        return job_id
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status and progress of a job, or None if it is unknown or expired."""
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {
+                'status': job['status'].value,
+                'attempt': job['attempt'],
+                'font_size': job['font_size'],
+                'error': job['error'],
+            }
+
+    def result(self, job_id: str) -> Optional[bytes]:
+        """PDF bytes of a finished job, or None if it is unknown, expired or not done."""
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            return job['result'] if job is not None else None
@@ -0,0 +1,93 @@
+"""
+Process-wide aggregation of generator metrics, rendered in the Prometheus text format.
+"""
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+PREFIX = 'ned'
+ATTEMPT_BUCKETS = (1, 2, 4, 8, 16)
+SECONDS_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+Sample = Tuple[str, str, str, float]  # name, type, help, value
+
+
+class _Histogram:
+    """Cumulative bucket counts with sum and count."""
+
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str) -> List[str]:
+        lines = [
+            f'{name}_bucket{{le="{bound}"}} {count}'
+            for bound, count in zip(self.buckets, self.counts)
+        ]
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum {self.sum}')
+        lines.append(f'{name}_count {self.count}')
+        return lines
+
+
+class MetricsRegistry:
+    """Totals over every sheet generated by this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sheets = 0
+        self.totals: Dict[str, float] = {}
+        self.stage_seconds: Dict[str, float] = {}
+        self.attempts = _Histogram(ATTEMPT_BUCKETS)
+        self.seconds = _Histogram(SECONDS_BUCKETS)
+
+    def observe(self, metrics: Dict[str, Any], seconds: float) -> None:
+        """Add the `metrics()` of one finished generator that ran for `seconds`."""
+        with self._lock:
+            self.sheets += 1
+            for key in ('widths_tried', 'packs_skipped', 'string_width_calls',
+                        'output_bytes'):
+                self.totals[key] = self.totals.get(key, 0) + metrics[key]
+            for stage, spent in metrics['timings'].items():
+                self.stage_seconds[stage] = self.stage_seconds.get(stage,
+                                                                   0.0) + spent
+            self.attempts.observe(metrics['attempts'])
+            self.seconds.observe(seconds)
+
+    def render(self, extra: Optional[List[Sample]] = None) -> str:
+        """Prometheus text exposition of the totals, followed by `extra` samples."""
+        p = PREFIX
+        with self._lock:
+            lines = [
+                f'# HELP {p}_sheets_total Sheets generated.',
+                f'# TYPE {p}_sheets_total counter',
+                f'{p}_sheets_total {self.sheets}',
+                f'# HELP {p}_stage_seconds_total Time spent in each generation stage.',
+                f'# TYPE {p}_stage_seconds_total counter',
+            ]
+            lines.extend(f'{p}_stage_seconds_total{{stage="{stage}"}} {seconds}'
+                         for stage, seconds in self.stage_seconds.items())
+            for key, value in self.totals.items():
+                lines.append(f'# TYPE {p}_{key}_total counter')
+                lines.append(f'{p}_{key}_total {value}')
+            lines.append(
+                f'# HELP {p}_layout_attempts Font sizes laid out per sheet.')
+            lines.append(f'# TYPE {p}_layout_attempts histogram')
+            lines.extend(self.attempts.lines(f'{p}_layout_attempts'))
+            lines.append(f'# HELP {p}_sheet_seconds Generation time per sheet.')
+            lines.append(f'# TYPE {p}_sheet_seconds histogram')
+            lines.extend(self.seconds.lines(f'{p}_sheet_seconds'))
+
+        for name, kind, help_text, value in extra or ():
+            lines.append(f'# HELP {p}_{name} {help_text}')
+            lines.append(f'# TYPE {p}_{name} {kind}')
+            lines.append(f'{p}_{name} {value}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,110 @@
+"""
+Content-addressed cache of generated PDFs, so identical sheet submissions skip generation.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from cachelib import FileSystemCache
+
+DEFAULT_MAX_ENTRIES = 64
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # 64 MB
+DEFAULT_DISK_THRESHOLD = 500  # max PDFs kept on disk
+
+
+def sheet_key(topics: List[Dict[str, Any]], meta: Dict[str, Any]) -> str:
+    """
+    Canonical hash of a sheet submission: its topics in order, the bytes of any
+    uploaded images and the generator options.
+    """
+    canonical = []
+    for topic in topics:
+        if 'file' in topic:
+            topic = dict(topic)
+            topic['file'] = hashlib.sha256(
+                topic['file'].getbuffer()).hexdigest()
+        canonical.append(topic)
+
+    payload = json.dumps({'topics': canonical, 'meta': meta},
+                         sort_keys=True,
+                         separators=(',', ':'),
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PDFCache:
+    """
+    Thread-safe LRU of PDF bytes bounded by entry count and total size, optionally
+    backed by a directory on disk that survives restarts.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        directory: Optional[str] = None,
+        disk_threshold: int = DEFAULT_DISK_THRESHOLD,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._disk = None
+        if directory is not None:
+            self._disk = FileSystemCache(directory,
+                                         threshold=disk_threshold,
+                                         default_timeout=0)
+
+    def _store(self, key: str, data: bytes) -> None:
+        """Insert into memory and evict LRU entries. Caller holds the lock."""
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        if len(data) > self.max_bytes:
+            return
+
+        self._entries[key] = data
+        self._size += len(data)
+        while (len(self._entries) > self.max_entries
+               or self._size > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the cached PDF for `key`, or None on a miss."""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+
+        data = self._disk.get(key) if self._disk is not None else None
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self._store(key, data)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Cache the PDF bytes generated for `key`."""
+        with self._lock:
+            self._store(key, data)
+        if self._disk is not None:
+            self._disk.set(key, data)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current memory usage."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self._size,
+            }
@@ -1,22 +1,37 @@
 import io
-import re
-import copy
+import os
+import math
+import multiprocessing
+import threading
+import time
 
 from PIL import Image
 import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from enum import Enum
-from typing import Any, Dict, List, Tuple
+from itertools import accumulate, repeat
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from PIL import Image
-from rectpack import PackingMode, float2dec, newPacker
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import inch
 from reportlab.lib.utils import ImageReader
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
+from reportlab.pdfgen.textobject import PDFTextObject
 
+import fontmetrics
+import imaging
+import packing
+import styledtext
 import wordwrap
+from lru import LRUCache
+from packing import DEFAULT_STRATEGY as DEFAULT_PACKING
+from packing import Packing, PackingStrategy, Placement
+from styledtext import STYLE_TYPES, StyledText, StyleType
 
 DEC_PRECISION = 6
 SCRIPT_FONT_SIZE = 0.7  # super/subscript font size
@@ -26,20 +41,19 @@ DEFAULT_FONT_SIZE = 11
 MIN_FONT_SIZE = 5  # can change?
 REDUCE_MULT = 0.15  # multiplier to reduce font size
 ROUND_VAL = 1  # rounding to nth place
+FIT_PRECISION = 0.1  # font size step when bisecting in fit mode
+FIT_SCAN_STEPS = 5  # steps above the bisected font size still tried in fit mode
+PARALLEL_WORKERS = os.cpu_count() or 1  # processes used by parallel preprocessing
+WRAP_CACHE_SIZE = 4096  # wrapped topics memoized across attempts and requests
+# Stages timed in CheatsheetGenerator.timings. 'preprocess' covers text wrapping, which
+# is also timed as 'wrap' unless it runs in worker processes, and image preparation.
+STAGES = ('normalize', 'parse', 'preprocess', 'wrap', 'pack', 'render', 'save')
 
 # Register fonts
 pdfmetrics.registerFont(TTFont('Bullet-Font', 'fonts/NotoSans-Regular.ttf'))
 pdfmetrics.registerFont(TTFont('Topic-Font', 'fonts/NotoSans-Bold.ttf'))
 
 
-class StyleType(Enum):
-    """Text styling types"""
-    NORMAL = "normal"
-    SUPERSCRIPT = "superscript"
-    SUBSCRIPT = "subscript"
-    COMBINED = "combined"
-
-
 class MediaType(Enum):
     """Supported topic media types"""
     TEXT = "text"
@@ -47,15 +61,124 @@ class MediaType(Enum):
 
 
 Topic = Dict[str, Any]
-StyledString = List[Tuple[str, StyleType]]
+LayoutPlan = Dict[str, Any]
+TopicChanges = Dict[str, List[int]]
+
+
+class StyledChunks(wordwrap.ChunkedText):
+    """
+    A styled string split into wrapping chunks. Chunk widths are measured with superscripts
+    and subscripts at their scaled font size, as they are drawn, and wrapped lines keep
+    the styles of the text they came from.
+    """
+    __slots__ = ('text', 'starts')
+
+    def __init__(self, text: StyledText):
+        # Tabs become single spaces so that chunk positions line up with the text's
+        super().__init__(wordwrap.tokenize(text.text, expand_tabs=False).chunks)
+        self.text = StyledText(''.join(self.chunks), text.offsets, text.styles)
+        self.starts = list(accumulate(map(len, self.chunks), initial=0))
+
+    def measure(self, wrapper: wordwrap.TextWrapper) -> Tuple[List[float], List[float]]:
+        if not any(self.text.styles):
+            return super().measure(wrapper)
+
+        key = (wrapper.font, wrapper.font_size)
+        measured = self._measured.get(key)
+        if measured is None:
+            script_size = wrapper.font_size * SCRIPT_FONT_SIZE
+            sizes = (wrapper.font_size, script_size, script_size)
+            text, offsets, styles = self.text.text, self.text.offsets, self.text.styles
+
+            # Walk chunks and segments together, measuring each piece at its style's size
+            widths = []
+            seg = 0
+            for start, end in zip(self.starts, self.starts[1:]):
+                width = 0
+                while start < end:
+                    while offsets[seg + 1] <= start:
+                        seg += 1
+                    stop = min(end, offsets[seg + 1])
+                    width += wrapper.canvas.stringWidth(text[start:stop],
+                                                        wrapper.font,
+                                                        sizes[styles[seg]])
+                    start = stop
+                widths.append(width)
+            measured = (widths, list(accumulate(widths, initial=0)))
+            self._measured[key] = measured
+        return measured
+
+    def lines(self, spans: List[Tuple[int, int]]) -> List[StyledText]:
+        """Styled lines of (start, end) chunk spans from `TextWrapper.wrap_spans`."""
+        return [
+            self.text.slice(self.starts[start], self.starts[end])
+            for start, end in spans
+        ]
+
+
+class ParsedTopic:
+    """
+    Normalized and style-parsed topic. Built once per generator and shared read-only by
+    every layout attempt; image topics keep their raw upload bytes. `chunks` holds the
+    title and each bullet split into styled wrapping chunks, so every width and font size
+    tried wraps them without splitting again.
+    """
+    __slots__ = ('media', 'topic', 'content', 'nowrap', 'key', 'data', 'chunks')
+
+    def __init__(
+        self,
+        media: MediaType,
+        topic: StyledText = None,
+        content: List[StyledText] = None,
+        nowrap: bool = False,
+        key: Tuple = None,
+        data: bytes = None,
+        chunks: List[StyledChunks] = None,
+    ):
+        self.media = media
+        self.topic = topic
+        self.content = content
+        self.nowrap = nowrap
+        self.key = key  # normalized text and options, identifies the wrapped result
+        self.data = data
+        self.chunks = chunks
 
-PATTERN = re.compile(
-    r"([^\^_]+)"  # Normal text
-    r"|(\^)\{([^\}]+)\}"  # Superscripts
-    r"|(_)\{([^\}]+)\}"  # Subscripts
-    r"|([^\^_]+)_\{([^\}]+)\}\^\{([^\}]+)\}"  # Combined subscript and superscript
-)
 
+class TopicLayout:
+    """Wrapped lines and dimensions of a topic at one font size."""
+    __slots__ = ('media', 'topic', 'content', 'width', 'height', 'file')
+
+    def __init__(
+        self,
+        media: MediaType,
+        width: float,
+        height: float = None,
+        topic: List[StyledText] = None,
+        content: List[StyledText] = None,
+        file: Any = None,
+    ):
+        self.media = media
+        self.width = width
+        self.height = height
+        self.topic = topic
+        self.content = content
+        self.file = file
+
+
+# Wrapped TopicLayouts keyed on (ParsedTopic.key, font size, page width).
+# Cached layouts are shared between generators and must not be mutated.
+_wrap_cache = LRUCache(WRAP_CACHE_SIZE)
+
+# Worker processes for parallel preprocessing, shared across requests. They are not
+# forked from the threaded server, whose other threads may hold locks at the fork.
+_pool = None
+_pool_lock = threading.Lock()
+_pool_context = multiprocessing.get_context(
+    'forkserver'
+    if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+# Generator reused by every topic preprocessed in a pool worker process
+_worker_generator = None
 
 class CheatsheetGenerator:
     """
@@ -68,74 +191,92 @@ class CheatsheetGenerator:
         dimensions: Tuple[float, float] = A4,
         font_size: float = DEFAULT_FONT_SIZE,
         max_pages: int = None,
+        fit: bool = False,
+        fit_precision: float = FIT_PRECISION,
+        parallel: bool = False,
+        progress: Optional[Callable[[int, float], None]] = None,
+        image_dpi: int = imaging.IMAGE_DPI,
+        image_quality: int = imaging.JPEG_QUALITY,
+        packing: Optional[str] = None,
+        previous: Optional[LayoutPlan] = None,
+        changes: Optional[TopicChanges] = None,
     ):
-        self.topics = topics
-        self.original_topics = copy.deepcopy(
-            topics)  # saved information in case of reseting
         self.width, self.height = dimensions
         self.font_size = font_size
         self.max_pages = max_pages
+        self.fit = fit  # bisect font size without drawing, then render once
+        self.fit_precision = fit_precision
+        self.parallel = parallel  # preprocess topics in worker processes
+        self.progress = progress  # called with (attempt, font size) per layout attempt
+        self.attempts = 0
+        self.image_dpi = image_dpi  # resolution images are resampled to
+        self.image_quality = image_quality  # JPEG re-encoding quality
+        # Algorithm placing topics on pages. Unless one is chosen, a shelf packing that
+        # fits max_pages is used when the default strategy overflows it.
+        self.packing = PackingStrategy(packing or DEFAULT_PACKING.value)
+        self.packing_fallback = packing is None
+        self.packing_used = self.packing  # strategy of the last plan
+        # Plan of an earlier version of the sheet, and the 'changed' and 'added' ids of
+        # `topics` and the 'removed' ids of the plan since then
+        self.previous = previous
+        self.changes = changes or {}
         self._pdf_buffer = io.BytesIO()
         self._canvas = canvas.Canvas(self._pdf_buffer, pagesize=A4)
+        self._measurer = fontmetrics.TextMeasurer()
+        self.timings = dict.fromkeys(STAGES, 0.0)  # seconds spent in each stage
+        self.widths_tried = 0  # widths text topics were wrapped at
+        self.output_bytes = 0  # size of the last rendered PDF
+        self.bounds = (0, 0)  # page bounds of the last layout attempt, see page_bounds()
+        self.packs_skipped = 0  # attempts decided by their page bounds without packing
+
+        with self._timed('normalize'):
+            normalized = [self._normalize_topic(t) for t in topics]
+        with self._timed('parse'):
+            self._parsed = [self._parse_topic(t) for t in normalized]
+        self.layouts: List[TopicLayout] = []  # topics laid out at the current font size
+        # Prepared image layouts by index, shared by all layout attempts
+        self._images: Dict[int, TopicLayout] = {}
+
+    @contextmanager
+    def _timed(self, stage: str) -> Iterator[None]:
+        """Add the time spent in the block to `stage` in self.timings."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] += time.perf_counter() - start
 
     def _render_parsed_text(
         self,
-        x: float,
-        y: float,
-        parsed_text: StyledString,
+        text: PDFTextObject,
+        parsed_text: StyledText,
         font: str,
-    ) -> None:
+        state: Tuple[Optional[str], Optional[float], float],
+    ) -> Tuple[Optional[str], Optional[float], float]:
         """
-        Render parsed text with LaTeX-style superscripts, subscripts, and combinations
-        on a ReportLab canvas.
-        """
-        for item in parsed_text:
-            if isinstance(item, tuple) and len(item) == 2:
-                text, style = item
-                if style == StyleType.NORMAL:
-                    self._canvas.setFont(font, self.font_size)
-                    self._canvas.drawString(x, y, text)
-                    x += self._canvas.stringWidth(text, font, self.font_size)
-                elif style == StyleType.SUPERSCRIPT:
-                    self._canvas.setFont(font,
-                                         self.font_size * SCRIPT_FONT_SIZE)
-                    self._canvas.drawString(x, y + self.font_size * Y_SCRIPT,
-                                            text)
-                    x += self._canvas.stringWidth(
-                        text, font, self.font_size * SCRIPT_FONT_SIZE)
-                elif style == StyleType.SUBSCRIPT:
-                    self._canvas.setFont(font,
-                                         self.font_size * SCRIPT_FONT_SIZE)
-                    self._canvas.drawString(x, y - self.font_size * Y_SCRIPT,
-                                            text)
-                    x += self._canvas.stringWidth(
-                        text, font, self.font_size * SCRIPT_FONT_SIZE)
-
-            elif isinstance(item, tuple) and len(item) == 4:  #combined
-                base, _, subscript, superscript = item
-                # Render base character
-                self._canvas.setFont(font, self.font_size)
-                self._canvas.drawString(x, y, base)
-                base_width = self._canvas.stringWidth(base, font,
-                                                      self.font_size)
-                x += base_width
-
-                # Render subscript
-                self._canvas.setFont(font, self.font_size * SCRIPT_FONT_SIZE)
-                subscript_width = self._canvas.stringWidth(
-                    subscript, font, self.font_size * SCRIPT_FONT_SIZE)
-                self._canvas.drawString(x, y - self.font_size * Y_SCRIPT,
-                                        subscript)
-
-                # Render superscript
-                self._canvas.setFont(font, self.font_size * SCRIPT_FONT_SIZE)
-                self._canvas.drawString(x + subscript_width,
-                                        y + self.font_size * Y_SCRIPT,
-                                        superscript)
-                x += subscript_width + self._canvas.stringWidth(
-                    superscript, font, self.font_size * SCRIPT_FONT_SIZE)
-
-        return x
+        Write parsed text with LaTeX-style superscripts and subscripts at the cursor of a
+        ReportLab text object. `state` is the text object's current (font, size, rise), and
+        each is only set when it changes. Returns the state after the text.
+        """
+        sizes, rises = self._style_metrics()
+        cur_font, cur_size, cur_rise = state
+        for segment, style in parsed_text.segments():
+            if font != cur_font or sizes[style] != cur_size:
+                cur_font, cur_size = font, sizes[style]
+                text.setFont(font, cur_size, leading=self.font_size)
+            if rises[style] != cur_rise:
+                cur_rise = rises[style]
+                text.setRise(cur_rise)
+            text.textOut(segment)
+
+        return cur_font, cur_size, cur_rise
+
+    def _style_metrics(self) -> Tuple[Tuple[float, ...], Tuple[float, ...]]:
+        """Font size and baseline offset of each style code at the current font size."""
+        script_size = self.font_size * SCRIPT_FONT_SIZE
+        script_rise = self.font_size * Y_SCRIPT
+        return ((self.font_size, script_size, script_size),
+                (0, script_rise, -script_rise))
 
     def _reset_canvas_and_buffer(self):
         """Resets the canvas and buffer for PDF regeneration."""
@@ -152,99 +293,70 @@ class CheatsheetGenerator:
             self.font_size - round(_topics * REDUCE_MULT, ROUND_VAL),
             ROUND_VAL)
 
-    @staticmethod
-    def _parse_style(content: Topic) -> None:
+    def _lower_font_to_bound(self) -> None:
         """
-        Parse a string for superscripts (^{}) and subscripts (_{}).
-        Edits content['content'] to a list of lists of tuples (text, style), where style can be 'normal', 'superscript', or 'subscript'.
-        This function MUST be called before any string width-reading, or else the width will be inaccurate.
+        Lowers font size for topics whose area alone overflows the page limit. Text area
+        grows about with the square of the font size, so this skips the sizes at which the
+        area would still take about as many pages as the lower bound.
         """
+        self.font_size = min(
+            round(self.font_size * math.sqrt(self.max_pages / self.bounds[0]),
+                  ROUND_VAL), round(self.font_size - 10**-ROUND_VAL, ROUND_VAL))
 
-        def _parse_str_style(text: str) -> StyledString:
-            results = []
-            matches = PATTERN.finditer(text)
-
-            for match in matches:
-                if match.group(1):  # Normal text
-                    results.append((match.group(1), StyleType.NORMAL))
-                elif match.group(2):  # Superscript
-                    results.append((match.group(3), StyleType.SUPERSCRIPT))
-                elif match.group(4):  # Subscript
-                    results.append((match.group(5), StyleType.SUBSCRIPT))
-                elif match.group(6):  # Combined subscript and superscript
-                    results.append((match.group(6), StyleType.COMBINED,
-                                    match.group(7), match.group(8)))
-            return results
-
-        content['topic'] = [_parse_str_style(content['topic'])]
-        content['content'] = [_parse_str_style(s) for s in content['content']]
+    @staticmethod
+    def _normalize_topic(topic: Topic) -> Topic:
+        """Unicode-normalize the text of a submitted topic."""
+        if MediaType(topic['media']) == MediaType.IMAGE:
+            return topic
+
+        return {
+            'media': topic['media'],
+            'topic': unicodedata.normalize('NFKD', topic['topic']),
+            'content': tuple(
+                unicodedata.normalize('NFKC', bullet).rstrip()
+                for bullet in topic['content']),
+            'nowrap': bool(topic.get('nowrap')),
+        }
 
-    def _styleStringWidth(self, text: StyledString, font: str) -> float:
+    @staticmethod
+    def _parse_topic(topic: Topic) -> ParsedTopic:
+        """Style-parse a normalized topic."""
+        media = MediaType(topic['media'])
+        if media == MediaType.IMAGE:
+            return ParsedTopic(media, data=topic['file'].getvalue())
+
+        title, content, nowrap = topic['topic'], topic['content'], topic['nowrap']
+
+        # Convert strs to StyledTexts
+        parsed = [styledtext.parse_style(s) for s in (title, *content)]
+        return ParsedTopic(media,
+                           topic=parsed[0],
+                           content=parsed[1:],
+                           nowrap=nowrap,
+                           key=(title, content, nowrap),
+                           chunks=None if nowrap else
+                           [StyledChunks(s) for s in parsed])
+
+    def _styleStringWidth(self, text: StyledText, font: str) -> float:
         """
         Wrapper for stringWidth function that accounts for superscripts and subscript dimension changes.
         """
         width = 0
+        sizes = self._style_metrics()[0]
 
-        for content, style in text:  # Iterate through tuples in the sublist
-            if style == StyleType.NORMAL:
-                current_font_size = self.font_size
-            else:
-                current_font_size = self.font_size * SCRIPT_FONT_SIZE
-
-            # Add the width of the current text with the current font size
-            width += self._canvas.stringWidth(content, font, current_font_size)
+        for content, style in text.segments():
+            # Add the width of the current text with its style's font size
+            width += self._measurer.stringWidth(content, font, sizes[style])
 
         return width
 
-    def _wrap_string_list(self, content: Topic) -> None:
+    def _wrap_string_list(self, text: ParsedTopic) -> TopicLayout:
         """Word-wrap topic to maximize space efficiency."""
 
-        def fake_wrap(
-            text: StyledString,
-            font: str,
-            width: int,
-        ) -> List[StyledString]:
-            """
-            Wrap the stringified version of the styled string `text`. Then, reconstruct the 
-            styled string using the lengths of the wrapped result. The "fake" aspect
-            of this function comes from not taking into account the width differences of
-            "xy" and "x^y" when choosing where to wrap. This does not cause functional issues, 
-            since we are overcompensating.
-            """
-            wrapped = wordwrap.wrap(''.join(p[0] for p in text),
-                                    self._canvas,
-                                    font,
-                                    self.font_size,
-                                    width,
-                                    break_long_words=False)
-
-            res = []
-            i = 0
-            c = 0
-            curSeg, curStyle = text[i]
-            for w in wrapped:
-                styled_str = []
-                curStr = ''
-                for wc in w:
-                    curStr += wc
-                    c += 1
-                    if c >= len(curSeg):
-                        styled_str.append((curStr, curStyle))
-                        curStr = ''
-                        i += 1
-                        c = 0
-                        if i < len(text):
-                            curSeg, curStyle = text[i]
-                if curStr:
-                    styled_str.append((curStr, curStyle))
-                res.append(styled_str)
-
-            return res
-
         min_size = float('inf')
 
-        raw_topic = content['topic'][0]
-        raw_content = content['content']
+        raw_topic = text.topic
+        raw_content = text.content
 
         max_str_len = max(
             self._styleStringWidth(raw_topic, 'Topic-Font'),
@@ -253,193 +365,702 @@ class CheatsheetGenerator:
                 default=float('-inf')))
 
         max_str_len = int(min(max_str_len, self.width))
-        content['width'] = max_str_len
-        if 'nowrap' in content and content['nowrap']:
+        layout = TopicLayout(MediaType.TEXT,
+                             max_str_len,
+                             topic=[raw_topic],
+                             content=raw_content)
+        if text.nowrap:
             # Do not wrap if nowrap is set
-            return
-
-        for width in range(max_str_len // 2, max_str_len + 1):
-            topic = fake_wrap(raw_topic, 'Topic-Font', width)
-            bullets = []
-            for s in raw_content:
-                bullets.extend(fake_wrap(s, 'Bullet-Font', width))
-
-            max_width = max(
-                [self._styleStringWidth(s, 'Bullet-Font') for s in bullets] +
-                [self._styleStringWidth(s, 'Topic-Font') for s in topic])
-            size = max_width * (len(bullets) + len(topic))
+            return layout
+
+        # Search widths in [max_str_len // 2, max_str_len] for the smallest area. A string's
+        # wrapped lines only change at a few chunk-boundary widths, so each string is
+        # re-wrapped only once the width passes its bound, and widths at which no string
+        # changes are skipped entirely. Lines are kept as chunk spans, measured from the
+        # styled chunk widths, and only turned into styled text for the best width so far.
+        wrappers = {
+            font: wordwrap.TextWrapper(self._measurer,
+                                       font,
+                                       self.font_size,
+                                       max_str_len,
+                                       break_long_words=False)
+            for font in ('Topic-Font', 'Bullet-Font')
+        }
+        strings = [(text.chunks[0], wrappers['Topic-Font'])]
+        strings.extend((chunks, wrappers['Bullet-Font'])
+                       for chunks in text.chunks[1:])
+        wrapped = [None] * len(strings)  # (spans, max line width, bound)
+
+        width = max_str_len // 2
+        while width <= max_str_len:
+            self.widths_tried += 1
+            for i, (chunks, wrapper) in enumerate(strings):
+                if wrapped[i] is None or wrapped[i][2] <= width:
+                    wrapper.width = width
+                    spans, bound = wrapper.wrap_spans(chunks)
+                    widths = chunks.measure(wrapper)[0]
+                    line_width = max(
+                        (sum(widths[start:end]) for start, end in spans),
+                        default=float('-inf'))
+                    wrapped[i] = (spans, line_width, bound)
+
+            max_width = max(w[1] for w in wrapped)
+            size = max_width * sum(len(w[0]) for w in wrapped)
 
             if size < min_size:
                 min_size = size
-                content['topic'] = topic
-                content['content'] = bullets
-                content['width'] = max_width
+                layout.topic = strings[0][0].lines(wrapped[0][0])
+                layout.content = [
+                    l for (chunks, _), w in zip(strings[1:], wrapped[1:])
+                    for l in chunks.lines(w[0])
+                ]
+                layout.width = max_width
+
+            next_width = min(w[2] for w in wrapped)
+            if next_width == float('inf'):
+                break
+            width = max(width + 1, math.ceil(next_width))
 
-    def _get_dimensions(self, content: Topic) -> Tuple[float, float]:
+        return layout
+
+    def _get_dimensions(self, layout: TopicLayout) -> Tuple[float, float]:
         """
         Calculate the width and height of the given content, considering text wrapping.
         Parameters:
-        - c: The ReportLab canvas object.
-        - content: The content dictionary containing topic, content, and media type.
-        - font_size: Font size for text.
-        - max_width: Maximum width of the text content before wrapping.
+        - layout: The laid out topic, with its wrapped lines or image size.
         Returns:
         - A tuple containing:
             - The maximum width of the content.
             - The total height of the content.
         """
-        media = MediaType(content['media'])
-        if media == MediaType.TEXT:
-            topic_height = self.font_size * (len(content['topic']) +
-                                             len(content['content']))
+        if layout.media == MediaType.TEXT:
+            topic_height = self.font_size * (len(layout.topic) +
+                                             len(layout.content))
 
-            return content['width'], topic_height
-        elif media == MediaType.IMAGE:
-            return content['width'], content['height']
+            return layout.width, topic_height
+        elif layout.media == MediaType.IMAGE:
+            return layout.width, layout.height
 
     def _place_content(
         self,
-        content: Topic,
+        layout: TopicLayout,
         x: float,
         y: float,
     ) -> None:
         """
         Place content directly at x and y on the given canvas.
         Parameters:
-        - c: The ReportLab canvas object.
-        - content: The content dictionary containing topic, content, and media type.
+        - layout: The laid out topic, with its wrapped lines or image.
         - x: X-coordinate to start drawing.
         - y: Y-coordinate to start drawing.
-        - font_size: Font size for text.
         """
-        match MediaType(content['media']):
+        match layout.media:
             case MediaType.TEXT:
-                i = 0
-                for s in content['topic']:
-                    self._render_parsed_text(x, y - ((i + 1) * self.font_size),
-                                             s, 'Topic-Font')
-                    i += 1
-
-                for s in content['content']:
-                    self._render_parsed_text(x, y - ((i + 1) * self.font_size),
-                                             s, 'Bullet-Font')
-                    i += 1
+                # One text object per topic, each line starting a font size below the last
+                lines = [(s, 'Topic-Font') for s in layout.topic]
+                lines.extend((s, 'Bullet-Font') for s in layout.content)
+                if not lines:
+                    return
+                text = self._canvas.beginText(x, y - self.font_size)
+                state = (None, None, 0)
+                for i, (s, font) in enumerate(lines):
+                    if i:
+                        text.moveCursor(0, self.font_size)
+                    state = self._render_parsed_text(text, s, font, state)
+                if state[2]:
+                    # Rise is part of the text state and outlives the text object
+                    text.setRise(0)
+                self._canvas.drawText(text)
 
             case MediaType.IMAGE:
-                image_height = content['height']
-                self._canvas.drawImage(ImageReader(content['file']),
+                image_height = layout.height
+                self._canvas.drawImage(layout.file,
                                        x,
                                        y - image_height,
-                                       width=content['width'],
+                                       width=layout.width,
                                        height=image_height)
 
-    def _preprocess_data(self) -> None:
-        """Perform necessary preprocessing on the inputted data"""
-        for content in self.topics:
-            media = MediaType(content['media'])
-            if media == MediaType.TEXT:
-                # Normalize unicode
-                content['topic'] = unicodedata.normalize(
-                    'NFKD', content['topic'])
-                normalized = []
-                for bullet in content['content']:
-                    normalized.append(
-                        unicodedata.normalize('NFKC', bullet).rstrip())
-                content['content'] = normalized
-
-                # Convert strs to StyledStrs
-                self._parse_style(content)
-
-                # Wrap lines
-                self._wrap_string_list(content)
-            elif media == MediaType.IMAGE:
-                # Convert binary to Image object
-                img = content['file'] = Image.open(content['file'])
-
-                # Resize image's longest side to 2 inches
-                image_width = img.width
-                image_height = img.height
-                scale_factor = max(image_height, image_height) / (2 * inch)
-                image_height /= scale_factor
-                image_width /= scale_factor
-
-                content['width'] = image_width
-                content['height'] = image_height
-
-    def create_pdf(self) -> io.BytesIO:
+    def _preprocess_topic(self, parsed: ParsedTopic) -> TopicLayout:
+        """Wrap a text topic at the current font size, or decode and size an image topic."""
+        if parsed.media == MediaType.TEXT:
+            # Wrap lines
+            with self._timed('wrap'):
+                return self._wrap_string_list(parsed)
+
+        # Convert binary to Image object
+        img = Image.open(io.BytesIO(parsed.data))
+
+        # Resize image's longest side to 2 inches
+        image_width = img.width
+        image_height = img.height
+        scale_factor = max(image_width, image_height) / (2 * inch)
+        image_height /= scale_factor
+        image_width /= scale_factor
+
+        # Resample to the placed size and re-encode for embedding
+        file = imaging.prepare_image(parsed.data, image_width, image_height,
+                                     self.image_dpi, self.image_quality)
+        return TopicLayout(MediaType.IMAGE, image_width, image_height, file=file)
+
+    def _preprocess_data(self,
+                         known: Optional[Dict[int, TopicLayout]] = None) -> None:
         """
-        Create a fully optimized cheatsheet from a list of topics. If the PDF exceeds the maximum
-        allowed pages, it will regenerate the PDF using smaller fonts until it fits.
-        
-        :return: io.BytesIO buffer containing the generated PDF.
+        Lay out every parsed topic at the current font size into self.layouts. Topics in
+        `known` are taken as already laid out.
         """
-        while self.font_size >= MIN_FONT_SIZE:
-            try:
-                print(
-                    f"Creating cheatsheet with font size {self.font_size}...")
-                self.topics = copy.deepcopy(self.original_topics)
-
-                # Reset the canvas and buffer
-                self._reset_canvas_and_buffer()
-
-                # Preprocess topics for packing
-                self._preprocess_data()
-
-                # Initialize the packer
-                packer = newPacker(mode=PackingMode.Online, rotation=False)
-
-                # Add infinite A4 bins
-                packer.add_bin(float2dec(self.width, DEC_PRECISION),
-                               float2dec(self.height, DEC_PRECISION),
-                               count=float('inf'))
-
-                # Pack topics into the bins
-                for i, content in enumerate(self.topics):
-                    w, h = self._get_dimensions(content)
-                    packer.add_rect(float2dec(w, DEC_PRECISION),
-                                    float2dec(h, DEC_PRECISION), i)
-
-                # Generate the PDF
-                for abin in packer:
-                    for rect in abin:
-                        x = float(rect.x)
-                        y = self.height - float(
-                            rect.y)  # Adjust for bottom-left origin
-                        w = float(rect.width)
-                        h = float(rect.height)
-                        rid = rect.rid
-
-                        content = self.topics[rid]
-                        self._place_content(content, x, y)
-
-                    # Add a new blank page for the next bin
-                    self._canvas.showPage()
-
-                # Ensure all topics are packed
-                assert len(packer.rect_list()) == len(self.topics)
-
-                # Save the PDF to the buffer
-                self._canvas.save()
-                self._pdf_buffer.seek(0)
-
-                # Check the page count
-                if self.max_pages == None or self.max_pages >= len(packer):
-                    print("PDF created successfully within page limit.")
-                    return self._pdf_buffer
-
-                # Reduce the font size if the page count exceeds the limit
-                print("PDF exceeds the page limit. Reducing font size...")
+        self.layouts = [None] * len(self._parsed)
+        pending = []  # (index, wrap cache key) of topics that still need work
+        for i, parsed in enumerate(self._parsed):
+            if known and i in known:
+                self.layouts[i] = known[i]
+                continue
+
+            if parsed.media != MediaType.TEXT:
+                if i in self._images:
+                    self.layouts[i] = self._images[i]
+                else:
+                    pending.append((i, None))
+                continue
+
+            # Reuse the wrapped layout if this text was already wrapped at this size
+            key = (parsed.key, self.font_size, self.width)
+            wrapped = _wrap_cache.get(key)
+            if wrapped is not None:
+                self.layouts[i] = wrapped
+            else:
+                pending.append((i, key))
+
+        todo = [self._parsed[i] for i, _ in pending]
+        if self.parallel and todo:
+            options = {
+                'font_size': self.font_size,
+                'width': self.width,
+                'height': self.height,
+                'image_dpi': self.image_dpi,
+                'image_quality': self.image_quality
+            }
+            results = _pool_map(_preprocess_in_worker,
+                                todo,
+                                options,
+                                chunksize=max(
+                                    1, len(todo) // (4 * PARALLEL_WORKERS)))
+        else:
+            results = map(self._preprocess_topic, todo)
+
+        # Merge results back in input order
+        for (i, key), layout in zip(pending, results):
+            self.layouts[i] = layout
+            if key is not None:
+                _wrap_cache.put(key, layout)
+            else:
+                self._keep_image(i, layout)
+
+    def _keep_image(self, i: int, layout: TopicLayout) -> None:
+        """Keep a prepared image layout; images don't depend on font size."""
+        layout.file = ImageReader(layout.file)
+        self._images[i] = layout
+
+    def _image_layout(self, i: int) -> TopicLayout:
+        """Prepared layout of image topic `i`, preparing it if no attempt has yet."""
+        if i not in self._images:
+            self._keep_image(i, self._preprocess_topic(self._parsed[i]))
+        return self._images[i]
+
+    def _rects(self) -> List[packing.Rect]:
+        return [(*self._get_dimensions(layout), i)
+                for i, layout in enumerate(self.layouts)]
+
+    def _pack(self) -> Packing:
+        """
+        Pack the preprocessed topics into as many pages as needed. Nothing is drawn. If no
+        strategy was chosen and the packing exceeds max_pages but a shelf packing is known
+        to fit, the shelf packing is used instead.
+        """
+        rects = self._rects()
+        packer = packing.pack(rects, self.width, self.height, self.packing)
+        if (self.packing_fallback and not self._fits(packer) and
+                self.bounds[1] <= self.max_pages):
+            packer = packing.pack(rects, self.width, self.height,
+                                  PackingStrategy.SHELF)
+
+        # Ensure all topics are packed
+        assert sum(len(page) for page in packer) == len(self.layouts)
+        return packer
+
+    def _shelf_pack(self) -> Packing:
+        """
+        Shelf packing of the preprocessed topics, for attempts whose page bounds already
+        decided whether they fit; its page count is the upper bound.
+        """
+        return packing.pack(self._rects(), self.width, self.height,
+                            PackingStrategy.SHELF)
+
+    def page_bounds(self) -> Tuple[int, int]:
+        """
+        Lower and upper bounds on the pages the preprocessed topics take: their total area
+        over the page area, and the pages of a fast shelf packing.
+        """
+        return packing.page_bounds(self._rects(), self.width, self.height)
+
+    def _decided(self) -> bool:
+        """
+        Whether self.bounds already prove that the topics fit max_pages or overflow it. The
+        shelf page count only proves a fit when a shelf packing may be used.
+        """
+        if self.max_pages is None:
+            return True
+        lower, upper = self.bounds
+        if lower > self.max_pages:
+            return True
+        shelf = self.packing_fallback or self.packing == PackingStrategy.SHELF
+        return shelf and upper <= self.max_pages
+
+    def _layout_at(self, font_size: float,
+                   bounded: bool = False) -> Optional[Packing]:
+        """
+        Lay out and pack the topics at `font_size`. If `bounded`, packing is skipped and None
+        returned when the page bounds decide whether the topics fit.
+        """
+        self.font_size = font_size
+        self.attempts += 1
+        if self.progress is not None:
+            self.progress(self.attempts, font_size)
+        with self._timed('preprocess'):
+            self._preprocess_data()
+        with self._timed('pack'):
+            self.bounds = self.page_bounds()
+            if bounded and self._decided():
+                self.packs_skipped += 1
+                return None
+            return self._pack()
+
+    def _repack(self) -> Optional[Packing]:
+        """
+        Update the previous plan at its font size for self.changes. Only changed and added
+        topics are laid out again, changed topics that still fit their old spot stay there,
+        and only pages that lost topics or hold changed topics that grew are repacked,
+        together with any added topics. Returns None if the result would take more pages
+        than the ones repacked, or the previous plan cannot be reused.
+        """
+        previous = self.previous
+        if (previous['width'], previous['height']) != (self.width, self.height):
+            return None
+
+        changed = set(self.changes.get('changed', ()))
+        added = set(self.changes.get('added', ()))
+        removed = set(self.changes.get('removed', ()))
+        old_count = len(previous['placements'])
+        if old_count - len(removed) + len(added) != len(self._parsed):
+            return None
+
+        # Kept topics keep their order, filling the ids that were not added
+        ids = dict(
+            zip((i for i in range(old_count) if i not in removed),
+                (i for i in range(len(self._parsed)) if i not in added)))
+
+        self.font_size = previous['font_size']
+        self.attempts += 1
+        if self.progress is not None:
+            self.progress(self.attempts, self.font_size)
+
+        # Reuse the wrapped lines of unchanged text topics
+        known = {}
+        for placement in previous['placements']:
+            i = ids.get(placement['id'])
+            if (i is not None and i not in changed and
+                    placement['media'] == MediaType.TEXT.value):
+                known[i] = TopicLayout(
+                    MediaType.TEXT,
+                    placement['w'],
+                    topic=[_styled_line(l) for l in placement['topic']],
+                    content=[_styled_line(l) for l in placement['content']])
+        with self._timed('preprocess'):
+            self._preprocess_data(known)
+
+        pages = [[] for _ in range(previous['pages'])]
+        affected = set()  # pages to repack
+        for placement in previous['placements']:
+            page = placement['page']
+            i = ids.get(placement['id'])
+            if i is None:
+                affected.add(page)
+                continue
+
+            w, h = self._get_dimensions(self.layouts[i])
+            if i in changed and (w > placement['w'] or h > placement['h']):
+                affected.add(page)
+            pages[page].append(
+                Placement(placement['x'], self.height - placement['y'], w, h, i))
+
+        if added and not affected:
+            if not pages:
+                return None
+            affected.add(len(pages) - 1)
+
+        rects = [(p.width, p.height, p.rid)
+                 for page in sorted(affected)
+                 for p in pages[page]]
+        rects.extend((*self._get_dimensions(self.layouts[i]), i)
+                     for i in sorted(added))
+        with self._timed('pack'):
+            repacked = packing.pack(rects, self.width, self.height,
+                                    self.packing)
+        if (len(repacked) > len(affected) or
+                sum(len(page) for page in repacked) != len(rects)):
+            return None
+
+        # Repacked pages take the place of the pages they replace
+        fresh = iter(repacked)
+        result = []
+        for n, page in enumerate(pages):
+            if n in affected:
+                page = next(fresh, None)
+            if page:
+                result.append(page)
+
+        packer = Packing(self.width, self.height, result, self.packing)
+        return packer if self._fits(packer) else None
+
+    def _fits(self, packer) -> bool:
+        return self.max_pages is None or self.max_pages >= len(packer)
+
+    def _try_fit(self, font_size: float) -> Tuple[bool, Optional[Packing]]:
+        """
+        Lay out the topics at `font_size` for fit mode. Returns whether they fit max_pages
+        and their packing, which is None when the page bounds decided it.
+        """
+        print(f"Trying font size {font_size}...")
+        packer = self._layout_at(font_size, bounded=True)
+        if packer is None:
+            return self.bounds[1] <= self.max_pages, None
+        return self._fits(packer), packer
+
+    def _fit_font_size(self):
+        """
+        Find a large font size, in steps of `fit_precision`, whose packing fits within
+        `max_pages` by bisection. Page counts do not always grow with the font size, so the
+        bisection result is a local optimum; the sizes up to FIT_SCAN_STEPS steps above the
+        largest fitting size found are tried as well. Only measures and packs; nothing is
+        drawn. Leaves the generator laid out at the chosen size and returns its packer.
+        """
+        print(f"Trying font size {self.font_size}...")
+        packer = self._layout_at(self.font_size)
+        if self._fits(packer):
+            return packer
+
+        step = self.fit_precision
+        lo = math.ceil(round(MIN_FONT_SIZE / step, DEC_PRECISION))
+        top = hi = math.ceil(round(self.font_size / step, DEC_PRECISION)) - 1
+        # (step index, font size, layouts, bounds, packer) of the largest fitting size
+        best = None
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            fits, packer = self._try_fit(round(mid * step, DEC_PRECISION))
+            if fits:
+                best = (mid, self.font_size, self.layouts, self.bounds, packer)
+                lo = mid + 1
+            else:
+                hi = mid - 1
+
+        if best is None:
+            print(
+                "Unable to fit within the page limit using the available font sizes."
+            )
+            if packer is None:
+                with self._timed('pack'):
+                    packer = self._pack()
+            return packer
+
+        # Scan upwards past sizes that overflow for larger sizes that fit again
+        index = last = best[0]
+        while index < top and index - last < FIT_SCAN_STEPS:
+            index += 1
+            fits, packer = self._try_fit(round(index * step, DEC_PRECISION))
+            if fits:
+                last = index
+                best = (index, self.font_size, self.layouts, self.bounds, packer)
+
+        _, self.font_size, self.layouts, self.bounds, packer = best
+        if packer is None:
+            # The page bounds proved that the shelf packing fits
+            with self._timed('pack'):
+                packer = self._shelf_pack()
+        return packer
+
+    def _plan(self, packer: Packing) -> LayoutPlan:
+        """Convert a packer at the current font size into a placement plan."""
+        self.packing_used = packer.strategy
+        placements = []
+        for page, abin in enumerate(packer):
+            for rect in abin:
+                layout = self.layouts[rect.rid]
+                placement = {
+                    'page': page,
+                    'x': rect.x,
+                    'y': self.height - rect.y,  # Adjust for bottom-left origin
+                    'w': rect.width,
+                    'h': rect.height,
+                    'id': rect.rid,
+                    'media': layout.media.value,
+                }
+                if layout.media == MediaType.TEXT:
+                    placement['topic'] = layout.topic
+                    placement['content'] = layout.content
+                placements.append(placement)
+
+        return {
+            'font_size': self.font_size,
+            'pages': len(packer),
+            'page_bounds': list(self.page_bounds()),
+            'packing': packer.strategy.value,
+            'whitespace': packer.whitespace(),
+            'width': self.width,
+            'height': self.height,
+            'placements': placements,
+        }
+
+    def layout(self) -> LayoutPlan:
+        """
+        Choose a font size and pack the topics without drawing anything. If the topics exceed
+        the maximum allowed pages, smaller fonts are tried until they fit. Given a previous
+        plan and changes, only the pages touched by the changes are repacked where possible.
+
+        :return: placement plan with the font size, page count, lower and upper bounds on
+        the page count (see page_bounds()), packing strategy used, fraction of page area
+        left blank and, for every topic, its page index, top-left corner (x, y) in PDF
+        points, width w, height h, topic id and wrapped topic/content lines (text topics
+        only).
+        """
+        if self.previous is not None:
+            font_size = self.font_size
+            packer = self._repack()
+            if packer is not None:
+                print(f"Repacked changed topics at font size {self.font_size}.")
+                return self._plan(packer)
+            print("Changes do not fit the previous layout. Laying out all topics...")
+            self.font_size = font_size
+
+        if self.fit:
+            return self._plan(self._fit_font_size())
+
+        while True:
+            print(f"Laying out cheatsheet with font size {self.font_size}...")
+            # Sizes whose page bounds settle the question are not packed with the chosen
+            # strategy: a proven fit takes the shelf packing, a proven overflow is not packed
+            packer = self._layout_at(self.font_size,
+                                     bounded=self.max_pages is not None)
+            if packer is None and self.bounds[0] <= self.max_pages:
+                with self._timed('pack'):
+                    packer = self._shelf_pack()
+            if packer is not None and self._fits(packer):
+                print("Layout fits within page limit.")
+                return self._plan(packer)
+
+            # Reduce the font size if the page count exceeds the limit
+            font_size = self.font_size
+            if packer is None:
+                self._lower_font_to_bound()
+            else:
                 self._lower_font(packer)
+            if font_size > MIN_FONT_SIZE > self.font_size:
+                # Try the smallest font size before giving up
+                self.font_size = MIN_FONT_SIZE
+            if self.font_size < MIN_FONT_SIZE:
+                print(
+                    "Unable to fit within the page limit using the available font sizes."
+                )
+                self.font_size = font_size
+                if packer is None:
+                    with self._timed('pack'):
+                        packer = self._pack()
+                return self._plan(packer)
+            print("Layout exceeds the page limit. Reducing font size...")
+
+    def render(self, plan: LayoutPlan) -> io.BytesIO:
+        """
+        Draw a placement plan onto a fresh canvas. The plan may come from `layout()` of any
+        generator of the same topics, either as is or as JSON from `plan_to_json`.
 
-            except Exception as e:
-                print(f"Error during PDF creation: {e}")
+        :return: buffer rewound to the start of the generated PDF.
+        """
+        self._reset_canvas_and_buffer()
+        self.font_size = plan['font_size']
+        self.packing_used = PackingStrategy(plan['packing'])
+
+        pages = [[] for _ in range(plan['pages'])]
+        for placement in plan['placements']:
+            pages[placement['page']].append(placement)
+
+        with self._timed('render'):
+            for page in pages:
+                for placement in page:
+                    if MediaType(placement['media']) == MediaType.TEXT:
+                        layout = TopicLayout(
+                            MediaType.TEXT,
+                            placement['w'],
+                            placement['h'],
+                            topic=[_styled_line(l) for l in placement['topic']],
+                            content=[_styled_line(l) for l in placement['content']])
+                    else:
+                        layout = self._image_layout(placement['id'])
+                    self._place_content(layout, placement['x'], placement['y'])
+
+                # Add a new blank page for the next bin
+                self._canvas.showPage()
+
+        # Save the PDF to the buffer
+        with self._timed('save'):
+            self._canvas.save()
+        self.output_bytes = self._pdf_buffer.tell()
+        self._pdf_buffer.seek(0)
+        return self._pdf_buffer
+
+    def estimate(self) -> Dict[str, Any]:
+        """
+        Bounds on the pages the topics take at the current font size, from wrapping them
+        alone; nothing is packed. 'fits' tells whether they fit max_pages when the bounds
+        prove it either way, and is None when only packing can tell.
+        """
+        with self._timed('preprocess'):
+            self._preprocess_data()
+        with self._timed('pack'):
+            self.bounds = self.page_bounds()
+
+        fits = None
+        if self._decided():
+            fits = self.max_pages is None or self.bounds[1] <= self.max_pages
+        return {
+            'font_size': self.font_size,
+            'max_pages': self.max_pages,
+            'lower': self.bounds[0],
+            'upper': self.bounds[1],
+            'fits': fits,
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        """Timings and counters of the work this generator has done."""
+        return {
+            'font_size': self.font_size,
+            'attempts': self.attempts,
+            'widths_tried': self.widths_tried,
+            'packs_skipped': self.packs_skipped,
+            'packing': self.packing_used.value,
+            'string_width_calls': self._measurer.calls,
+            'output_bytes': self.output_bytes,
+            'timings': dict(self.timings),
+        }
+
+    def create_pdf(self, plan: Optional[LayoutPlan] = None) -> io.BytesIO:
+        """
+        Create a fully optimized cheatsheet from a list of topics. If the PDF exceeds the maximum
+        allowed pages, smaller fonts are laid out until it fits, and only the final layout is
+        rendered.
+        
+        :param plan: plan of these topics to render instead of laying them out, such as one
+        previewed through /layout.
+        :return: buffer containing the generated PDF.
+        """
+        try:
+            if plan is None:
+                plan = self.layout()
+            print(f"Creating cheatsheet with font size {plan['font_size']} on "
+                  f"{plan['pages']} pages ({plan['whitespace']:.1%} whitespace)...")
+            return self.render(plan)
+        except Exception as e:
+            print(f"Error during PDF creation: {e}")
+            raise
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    """Counters of the caches shared by all generators in this process."""
+    return {
+        'wrap': _wrap_cache.stats(),
+        'image': imaging._image_cache.stats(),
+    }
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all generators, created on first use and kept warm."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PARALLEL_WORKERS,
+                                        mp_context=_pool_context,
+                                        initializer=_init_worker)
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a broken pool, unless another thread already replaced it."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _pool_map(fn: Callable, items: List[Any], *args: Any,
+              chunksize: int = 1) -> List[Any]:
+    """
+    Map fn(item, *args) over `items` on the shared pool. If a worker died and broke the
+    pool, the pool is replaced and the map retried once.
+    """
+    for retry in (True, False):
+        pool = _get_pool()
+        try:
+            return list(
+                pool.map(fn,
+                         items,
+                         *(repeat(arg) for arg in args),
+                         chunksize=chunksize))
+        except BrokenProcessPool:
+            print("Worker process died, restarting the process pool...")
+            _discard_pool(pool)
+            if not retry:
                 raise
 
-        print(
-            "Unable to create a PDF within the page limit using the available font sizes."
-        )
-        return self._pdf_buffer  # return whatever works with some error message for user
 
+def _init_worker() -> None:
+    """Create the generator a pool worker process preprocesses topics with."""
+    global _worker_generator
+    _worker_generator = CheatsheetGenerator([])
+
+
+def _preprocess_in_worker(parsed: ParsedTopic,
+                          options: Dict[str, Any]) -> TopicLayout:
+    """
+    Preprocess a single topic in a pool worker process, with the worker's generator set
+    to the font size, page size and image options of the requesting generator.
+    """
+    for name, value in options.items():
+        setattr(_worker_generator, name, value)
+    return _worker_generator._preprocess_topic(parsed)
+
+
+def _styled_line(line: Any) -> StyledText:
+    """A wrapped line from a plan, either as is or as JSON from plan_to_json."""
+    if isinstance(line, StyledText):
+        return line
+    return StyledText.from_segments(
+        (text, STYLE_TYPES.index(StyleType(style))) for text, style in line)
+
+
+def plan_to_json(plan: LayoutPlan) -> Dict[str, Any]:
+    """Return a copy of a placement plan with styled lines made JSON serializable."""
+
+    def _line(line: StyledText) -> List[List[str]]:
+        return [[text, STYLE_TYPES[style].value]
+                for text, style in line.segments()]
+
+    placements = []
+    for placement in plan['placements']:
+        placement = dict(placement)
+        for key in ('topic', 'content'):
+            if key in placement:
+                placement[key] = [_line(l) for l in placement[key]]
+        placements.append(placement)
+
+    return {**plan, 'placements': placements}
 
 if __name__ == "__main__":
     data_dict = []
@@ -0,0 +1,165 @@
+"""
+Profiling of single sheet generations. A profile bundle is a ZIP holding the serialized
+sheet input, the profile and the generated PDF, so slow sheets can be replayed offline.
+
+Usage: python profiling.py BUNDLE.zip|input.json [-m cprofile|sampling] [-o profile.zip]
+"""
+import argparse
+import base64
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import zipfile
+from collections import Counter
+from enum import Enum
+from typing import Any, Callable, Dict, List, Tuple
+
+from pdfgen import CheatsheetGenerator, Topic
+
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+REPORT_LINES = 60  # functions listed in the text report
+INPUT_NAME = 'input.json'
+
+
+class ProfileMode(Enum):
+    """Available profilers"""
+    CPROFILE = "cprofile"  # deterministic, pstats output
+    SAMPLING = "sampling"  # stack sampling, collapsed stacks for flamegraphs
+
+
+def serialize_sheet(topics: List[Topic], meta: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON-serializable copy of a sheet submission, with images base64-encoded."""
+    serialized = []
+    for topic in topics:
+        if 'file' in topic:
+            topic = dict(topic,
+                         file=base64.b64encode(topic['file'].getvalue()).decode())
+        serialized.append(topic)
+    return {'topics': serialized, 'meta': meta}
+
+
+def deserialize_sheet(data: Dict[str, Any]) -> Tuple[List[Topic], Dict[str, Any]]:
+    """Topics and options from `serialize_sheet` output."""
+    topics = []
+    for topic in data['topics']:
+        if 'file' in topic:
+            topic = dict(topic, file=io.BytesIO(base64.b64decode(topic['file'])))
+        topics.append(topic)
+    return topics, data['meta']
+
+
+class _Sampler(threading.Thread):
+    """Samples the stack of another thread, counting identical stacks."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} "
+                             f"({os.path.basename(code.co_filename)}:"
+                             f"{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self._done.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format read by flamegraph.pl and speedscope."""
+        return ''.join(f"{stack} {count}\n"
+                       for stack, count in self.stacks.most_common())
+
+
+def profile_call(fn: Callable[[], Any],
+                 mode: ProfileMode) -> Tuple[Any, Dict[str, bytes]]:
+    """Call `fn` under a profiler, returning its result and the profile files by name."""
+    mode = ProfileMode(mode)
+    if mode == ProfileMode.SAMPLING:
+        sampler = _Sampler(threading.get_ident())
+        sampler.start()
+        try:
+            result = fn()
+        finally:
+            sampler.stop()
+        return result, {'profile.collapsed': sampler.collapsed().encode()}
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = fn()
+    finally:
+        profiler.disable()
+
+    report = io.StringIO()
+    stats = pstats.Stats(profiler, stream=report)
+    stats.sort_stats('cumulative').print_stats(REPORT_LINES)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'profile.pstats')
+        stats.dump_stats(path)
+        with open(path, 'rb') as f:
+            dump = f.read()
+    return result, {
+        'profile.pstats': dump,
+        'profile.txt': report.getvalue().encode()
+    }
+
+
+def profile_sheet(topics: List[Topic], meta: Dict[str, Any],
+                  mode: ProfileMode = ProfileMode.CPROFILE) -> bytes:
+    """Generate a sheet under a profiler and return the profile bundle as ZIP bytes."""
+    sheet = json.dumps(serialize_sheet(topics, meta))
+    cg = CheatsheetGenerator(topics, **meta)
+    pdf, files = profile_call(lambda: cg.create_pdf().getvalue(), mode)
+    files[INPUT_NAME] = sheet.encode()
+    files['metrics.json'] = json.dumps(cg.metrics(), indent=2).encode()
+    files['generated.pdf'] = pdf
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buf.getvalue()
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Replay a sheet input under a profiler.")
+    parser.add_argument('input', help="profile bundle or sheet input JSON")
+    parser.add_argument('-m',
+                        '--mode',
+                        default=ProfileMode.CPROFILE.value,
+                        choices=[m.value for m in ProfileMode])
+    parser.add_argument('-o', '--output', default='profile.zip')
+    args = parser.parse_args(argv)
+
+    if zipfile.is_zipfile(args.input):
+        with zipfile.ZipFile(args.input) as archive:
+            data = json.loads(archive.read(INPUT_NAME))
+    else:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+    topics, meta = deserialize_sheet(data)
+    with open(args.output, 'wb') as f:
+        f.write(profile_sheet(topics, meta, ProfileMode(args.mode)))
+    print(f"Wrote profile to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
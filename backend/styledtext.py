@@ -0,0 +1,101 @@
+"""
+Compact representation of text with LaTeX-style ^{} superscript and _{} subscript markup.
+"""
+import re
+from bisect import bisect_left, bisect_right
+from enum import Enum
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+STYLE_CACHE_SIZE = 8192  # parsed strings memoized across requests
+
+# Style codes stored per segment
+NORMAL = 0
+SUPERSCRIPT = 1
+SUBSCRIPT = 2
+
+
+class StyleType(Enum):
+    """Text styling types"""
+    NORMAL = "normal"
+    SUPERSCRIPT = "superscript"
+    SUBSCRIPT = "subscript"
+    COMBINED = "combined"
+
+
+STYLE_TYPES = (StyleType.NORMAL, StyleType.SUPERSCRIPT, StyleType.SUBSCRIPT)
+
+PATTERN = re.compile(
+    r"([^\^_]+)"  # Normal text
+    r"|(\^)\{([^\}]+)\}"  # Superscripts
+    r"|(_)\{([^\}]+)\}"  # Subscripts
+    r"|([^\^_]+)_\{([^\}]+)\}\^\{([^\}]+)\}"  # Combined subscript and superscript
+)
+
+
+class StyledText:
+    """
+    Plain text split into styled segments, stored as parallel arrays: segment i is
+    text[offsets[i]:offsets[i + 1]] drawn with style code styles[i]. Never mutated.
+    """
+    __slots__ = ('text', 'offsets', 'styles')
+
+    def __init__(self, text: str, offsets: Sequence[int], styles: bytes):
+        self.text = text
+        self.offsets = tuple(offsets)  # segment starts, followed by len(text)
+        self.styles = styles
+
+    def __len__(self) -> int:
+        return len(self.styles)
+
+    def __repr__(self) -> str:
+        return f"StyledText({list(self.segments())!r})"
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[Tuple[str, int]]) -> 'StyledText':
+        """Build from (text, style code) pairs."""
+        parts: List[str] = []
+        offsets = [0]
+        styles = bytearray()
+        for text, style in segments:
+            parts.append(text)
+            offsets.append(offsets[-1] + len(text))
+            styles.append(style)
+        return cls(''.join(parts), offsets, bytes(styles))
+
+    def slice(self, start: int, stop: int) -> 'StyledText':
+        """Styled text[start:stop], keeping the styles of the segments it overlaps."""
+        offsets = self.offsets
+        first = bisect_right(offsets, start) - 1
+        last = max(bisect_left(offsets, stop), first + 1)
+        return StyledText(self.text[start:stop],
+                          [0] + [o - start for o in offsets[first + 1:last]] +
+                          [stop - start], self.styles[first:last])
+
+    def segments(self) -> Iterator[Tuple[str, int]]:
+        """Yield (text, style code) for every segment."""
+        text, offsets = self.text, self.offsets
+        for i, style in enumerate(self.styles):
+            yield text[offsets[i]:offsets[i + 1]], style
+
+
+@lru_cache(maxsize=STYLE_CACHE_SIZE)
+def parse_style(text: str) -> StyledText:
+    """
+    Parse a string for superscripts (^{}) and subscripts (_{}).
+    A combined x_{a}^{b} becomes a normal, a subscript and a superscript segment.
+    This function MUST be called before any string width-reading, or else the width will be inaccurate.
+    """
+    segments: List[Tuple[str, int]] = []
+    for match in PATTERN.finditer(text):
+        if match.group(1):  # Normal text
+            segments.append((match.group(1), NORMAL))
+        elif match.group(2):  # Superscript
+            segments.append((match.group(3), SUPERSCRIPT))
+        elif match.group(4):  # Subscript
+            segments.append((match.group(5), SUBSCRIPT))
+        elif match.group(6):  # Combined subscript and superscript
+            segments.extend(((match.group(6), NORMAL), (match.group(7), SUBSCRIPT),
+                             (match.group(8), SUPERSCRIPT)))
+
+    return StyledText.from_segments(segments)
@@ -0,0 +1,19 @@
+"""
+Smoke test of the benchmark harness on an image-heavy synthetic sheet.
+"""
+import json
+
+import benchmark
+
+
+def test_image_heavy_case(tmp_path):
+    output = tmp_path / 'benchmark.json'
+    assert benchmark.main([
+        '--repeat', '1', '--topics', '80', '--bullet-length', '80',
+        '--images', '30', '--max-pages', '0', '--seed', '2', '--no-example',
+        '-o', str(output)
+    ]) == 0
+
+    [result] = json.loads(output.read_text())['results']
+    assert result['topics'] == 110
+    assert result['pages'] > 0
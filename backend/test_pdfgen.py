@@ -0,0 +1,89 @@
+"""
+Tests of laying out and rendering sheets with CheatsheetGenerator.
+"""
+import io
+import json
+import os
+import re
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import benchmark
+import pdfgen
+from pdfgen import CheatsheetGenerator, plan_to_json
+
+
+def image_objects(pdf: bytes) -> int:
+    return len(re.findall(rb'/Subtype /Image', pdf))
+
+
+def pages(pdf: bytes) -> int:
+    return len(re.findall(rb'/Type /Page\b', pdf))
+
+
+def test_parallel_preprocessing_keeps_repeated_images_deduplicated():
+    """
+    Images prepared in worker processes are still stored once per distinct image, as when
+    they are prepared serially.
+    """
+    topics = benchmark.synthetic_corpus(5, 40, images=3, seed=1)
+    # The same images again, as new uploads with identical contents
+    topics += [{
+        'media': 'image',
+        'file': io.BytesIO(topic['file'].getvalue())
+    } for topic in topics[-3:]]
+
+    pdfs = []
+    for parallel in (False, True):
+        cg = CheatsheetGenerator(topics, parallel=parallel)
+        pdfs.append(cg.render(cg.layout()).getvalue())
+
+    serial, parallel = pdfs
+    assert image_objects(serial) == 3
+    assert image_objects(parallel) == image_objects(serial)
+
+
+def test_render_json_plan_on_new_generator():
+    """A plan previewed through /layout renders on a generator that never laid it out."""
+    topics = benchmark.synthetic_corpus(20, 60, images=2, seed=3)
+    cg = CheatsheetGenerator(topics)
+    plan = cg.layout()
+    expected = cg.render(plan).getvalue()
+
+    previewed = json.loads(json.dumps(plan_to_json(plan)))
+    pdf = CheatsheetGenerator(topics).render(previewed).getvalue()
+    assert pages(pdf) == pages(expected) == plan['pages']
+    assert image_objects(pdf) == image_objects(expected) == 2
+    assert len(pdf) == len(expected)
+
+
+def test_fit_finds_sizes_above_a_page_count_dip():
+    """
+    On the example sheet 6.4pt takes 4 pages while 6.5pt to 6.7pt take 3, so bisection
+    alone stops at 6.3pt, below what the step-down loop reaches.
+    """
+    fonts = []
+    for fit in (False, True):
+        cg = CheatsheetGenerator(benchmark.example_corpus(),
+                                 max_pages=3,
+                                 fit=fit,
+                                 packing='rectpack')
+        plan = cg.layout()
+        assert plan['pages'] <= 3
+        fonts.append(plan['font_size'])
+
+    step_down, fitted = fonts
+    assert fitted >= step_down == 6.7
+
+
+def test_parallel_preprocessing_survives_a_dead_worker():
+    """A worker dying breaks the shared pool; the next parallel layout replaces it."""
+    with pytest.raises(BrokenProcessPool):
+        pdfgen._get_pool().submit(os._exit, 1).result()
+
+    topics = benchmark.synthetic_corpus(10, 40, images=1, seed=4)
+    parallel = CheatsheetGenerator(topics, parallel=True).layout()
+    serial = CheatsheetGenerator(topics).layout()
+    assert parallel['font_size'] == serial['font_size']
+    assert parallel['placements'] == serial['placements']
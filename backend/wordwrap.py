@@ -1,16 +1,55 @@
 """
 Modified TextWrapper that uses a ReportLab canvas to wrap using size in inches rather than character count.
+Any object with a canvas-compatible stringWidth (e.g. fontmetrics.TextMeasurer) can be used in place of the canvas.
 Forked from https://github.com/python/cpython/blob/3.13/Lib/textwrap.py
 """
+import copy
 import re
+from bisect import bisect_right
+from itertools import accumulate
 
-__all__ = ['TextWrapper', 'wrap', 'fill', 'dedent', 'indent', 'shorten']
+__all__ = ['TextWrapper', 'ChunkedText', 'tokenize', 'wrap', 'wrap_bounded',
+           'wrap_many', 'fill', 'dedent', 'indent', 'shorten']
 
 # Hardcode the recognized whitespace characters to the US-ASCII
 # whitespace characters.  The main reason for doing this is that
 # some Unicode spaces (like \u00a0) are non-breaking whitespaces.
 _whitespace = '\t\n\x0b\x0c\r '
 
+class ChunkedText:
+    """
+    Text already split into chunks by TextWrapper.tokenize(), so it can be
+    wrapped many times without munging and splitting it again.  Chunk
+    widths are measured on first use and kept per (font, font_size).
+
+    Only wrap it with wrappers that split text the same way as the one
+    that tokenized it (same expand_tabs, tabsize, replace_whitespace,
+    fix_sentence_endings and break_on_hyphens).
+    """
+    __slots__ = ('chunks', '_measured')
+
+    def __init__(self, chunks):
+        self.chunks = tuple(chunks)
+        self._measured = {}
+
+    def __repr__(self):
+        return 'ChunkedText(%r)' % (self.chunks,)
+
+    def measure(self, wrapper):
+        """measure(wrapper : TextWrapper) -> ([float], [float])
+
+        Return the width of every chunk in the wrapper's font and size,
+        and the running totals of those widths starting from 0.
+        """
+        key = (wrapper.font, wrapper.font_size)
+        measured = self._measured.get(key)
+        if measured is None:
+            widths = wrapper._chunk_widths(self.chunks)
+            measured = (widths, list(accumulate(widths, initial=0)))
+            self._measured[key] = measured
+        return measured
+
+
 class TextWrapper:
     """
     Object for wrapping/filling text.  The public interface consists of
@@ -147,6 +186,20 @@ class TextWrapper:
         """Return the length of the text when printed on the canvas"""
         return self.canvas.stringWidth(text, self.font, self.font_size)
 
+    def _prefix_widths(self, text):
+        """Return the widths of every prefix of text, from text[:0] to text"""
+        prefix_widths = getattr(self.canvas, 'prefix_widths', None)
+        if prefix_widths is not None:
+            return prefix_widths(text, self.font, self.font_size)
+        return [self._width_on_canvas(text[:i]) for i in range(len(text) + 1)]
+
+    def _chunk_widths(self, chunks):
+        """Return the width of every chunk"""
+        chunk_widths = getattr(self.canvas, 'chunk_widths', None)
+        if chunk_widths is not None:
+            return chunk_widths(chunks, self.font, self.font_size)
+        return [self._width_on_canvas(c) for c in chunks]
+
     def _munge_whitespace(self, text):
         """_munge_whitespace(text : string) -> string
 
@@ -220,8 +273,9 @@ class TextWrapper:
         # of the next chunk onto the current line as will fit.
         if self.break_long_words:
             chunk = reversed_chunks[-1]
-            end = next(i for i in range(len(chunk)) if self._width_on_canvas(chunk[:i+1]) > space_left)-1
-            if self.break_on_hyphens and self._width_on_canvas(chunk) > space_left:
+            prefix = self._prefix_widths(chunk)
+            end = bisect_right(prefix, space_left, 1) - 2
+            if self.break_on_hyphens and prefix[-1] > space_left:
                 # break after last hyphen, but only if there are
                 # non-hyphens before it
                 hyphen = chunk.rfind('-', 0, end)
@@ -245,6 +299,14 @@ class TextWrapper:
     def _wrap_chunks(self, chunks):
         """_wrap_chunks(chunks : [string]) -> [string]
 
+        See _wrap_chunks_bounded().
+        """
+        return self._wrap_chunks_bounded(chunks)[0]
+
+    def _wrap_chunks_bounded(self, chunks, measured=None):
+        """_wrap_chunks_bounded(chunks : [string], measured=None)
+            -> ([string], float)
+
         Wrap a sequence of text chunks and return a list of lines of
         length 'self.width' or less.  (If 'break_long_words' is false,
         some lines may be longer than this.)  Chunks correspond roughly
@@ -254,8 +316,19 @@ class TextWrapper:
         whitespace; ie. a chunk is either all whitespace or a "word".
         Whitespace chunks will be removed from the beginning and end of
         lines, but apart from that whitespace is preserved.
+
+        Also returns the smallest width above 'self.width' at which the
+        lines could change: wrapping at any width in [self.width, bound)
+        gives the same result.  The bound is only tracked for plain greedy
+        wrapping (no long word breaking, indents or max_lines); otherwise
+        it is 'self.width' itself.
+
+        'measured' optionally gives the chunk widths and their running
+        totals (see ChunkedText.measure()) for plain greedy wrapping.
         """
         lines = []
+        bound = float('inf')
+        exact = self._plain_greedy()
         if self.width <= 0:
             raise ValueError("invalid width %r (must be > 0)" % self.width)
         if self.max_lines is not None:
@@ -266,6 +339,13 @@ class TextWrapper:
             if self._width_on_canvas(indent + self.placeholder.lstrip()) > self.width:
                 raise ValueError("placeholder too large for max width")
 
+        # Plain greedy wrapping works on the chunk widths measured up front.
+        if exact:
+            if measured is None:
+                widths = self._chunk_widths(chunks)
+                measured = (widths, list(accumulate(widths, initial=0)))
+            return self._greedy_wrap(chunks, *measured, self.width)
+
         # Arrange in reverse order so items can be efficiently popped
         # from a stack of chucks.
         chunks.reverse()
@@ -299,15 +379,19 @@ class TextWrapper:
                     cur_line.append(chunks.pop())
                     cur_len += l
 
-                # Nope, this line is full.
+                # Nope, this line is full.  It stays full until the width
+                # reaches cur_len + l.
                 else:
+                    bound = min(bound, cur_len + l)
                     break
 
             # The current line is full, and the next chunk is too big to
             # fit on *any* line (not just this one).
             if chunks and self._width_on_canvas(chunks[-1]) > width:
+                line_chunks = len(cur_line)
                 self._handle_long_word(chunks, cur_line, cur_len, width)
-                cur_len = sum(map(self._width_on_canvas, cur_line))
+                if len(cur_line) > line_chunks:
+                    cur_len += self._width_on_canvas(cur_line[-1])
 
             # If the last chunk on this line is all whitespace, drop it.
             if self.drop_whitespace and cur_line and cur_line[-1].strip() == '':
@@ -343,16 +427,114 @@ class TextWrapper:
                         lines.append(indent + self.placeholder.lstrip())
                     break
 
-        return lines
+        return lines, (bound if exact else self.width)
+
+    def _greedy_wrap(self, chunks, widths, prefix, width):
+        """_greedy_wrap(chunks : [string], widths : [float],
+                        prefix : [float], width : float) -> ([string], float)
+
+        The plain greedy case of _wrap_chunks_bounded(), on chunks measured
+        up front (see _greedy_spans()).
+        """
+        spans, bound = self._greedy_spans(chunks, widths, prefix, width)
+        return [''.join(chunks[start:end]) for start, end in spans], bound
+
+    def _greedy_spans(self, chunks, widths, prefix, width):
+        """_greedy_spans(chunks : [string], widths : [float],
+                         prefix : [float], width : float)
+            -> ([(int, int)], float)
+
+        Greedily wrap chunks measured up front: 'widths' holds the width of
+        every chunk and 'prefix' their running totals, starting at 0.  Each
+        line break is found by bisecting the running totals instead of
+        measuring chunk by chunk, so the chunks can be wrapped at any number
+        of widths.  Return each line as the (start, end) chunk indices it
+        joins, and the bound of _wrap_chunks_bounded().
+        """
+        spans = []
+        bound = float('inf')
+        n = len(chunks)
+        i = 0
+        while i < n:
+
+            # First chunk on line is whitespace -- drop it, unless this
+            # is the very beginning of the text (ie. no lines started yet).
+            if self.drop_whitespace and spans and chunks[i].strip() == '':
+                i += 1
+                if i == n:
+                    break
+
+            # Find the chunks that fit from the running totals, then settle
+            # the break on the line's own sum so that float rounding gives
+            # the same lines as adding the chunks one at a time.
+            j = bisect_right(prefix, prefix[i] + width, i) - 1
+            cur_len = 0
+            for k in range(i, j):
+                cur_len += widths[k]
+            while j > i and cur_len > width:
+                j -= 1
+                cur_len = 0
+                for k in range(i, j):
+                    cur_len += widths[k]
+            while j < n and cur_len + widths[j] <= width:
+                cur_len += widths[j]
+                j += 1
+
+            if j < n:
+                # This line is full.  It stays full until the width
+                # reaches cur_len + widths[j].
+                bound = min(bound, cur_len + widths[j])
+
+                # The next chunk is too big to fit on any line and long
+                # words are kept intact: it gets a line of its own.
+                if j == i:
+                    j += 1
+
+            # If the last chunk on this line is all whitespace, drop it.
+            end = j
+            if self.drop_whitespace and chunks[end - 1].strip() == '':
+                end -= 1
+            if end > i:
+                spans.append((i, end))
+            i = j
+
+        return spans, bound
 
     def _split_chunks(self, text):
         text = self._munge_whitespace(text)
         return self._split(text)
 
+    def _plain_greedy(self):
+        """Whether wrapping is plain greedy wrapping of whole chunks"""
+        return not (self.break_long_words or self.max_lines is not None or
+                    self.initial_indent or self.subsequent_indent)
+
+    def _text_chunks(self, text):
+        """Return the chunks of 'text', a string or ChunkedText, as a new
+        list, and the measured chunk widths if 'text' has them for plain
+        greedy wrapping (None otherwise).
+        """
+        if isinstance(text, ChunkedText):
+            measured = text.measure(self) if self._plain_greedy() else None
+            return list(text.chunks), measured
+        chunks = self._split_chunks(text)
+        if self.fix_sentence_endings:
+            self._fix_sentence_endings(chunks)
+        return chunks, None
+
     # -- Public interface ----------------------------------------------
 
+    def tokenize(self, text):
+        """tokenize(text : string) -> ChunkedText
+
+        Munge and split 'text' into chunks once, for wrapping it many
+        times.  The result can be passed to wrap(), wrap_bounded(),
+        wrap_many() and fill() in place of the text.
+        """
+        return ChunkedText(self._text_chunks(text)[0])
+
     def wrap(self, text):
-        """wrap(text : string) -> [string]
+        """wrap(text : string | ChunkedText) -> [string]
 
         Reformat the single paragraph in 'text' so it fits in lines of
         no more than 'self.width' columns, and return a list of wrapped
@@ -360,13 +542,68 @@ class TextWrapper:
         and all other whitespace characters (including newline) are
         converted to space.
         """
-        chunks = self._split_chunks(text)
-        if self.fix_sentence_endings:
-            self._fix_sentence_endings(chunks)
-        return self._wrap_chunks(chunks)
+        return self._wrap_chunks_bounded(*self._text_chunks(text))[0]
+
+    def wrap_bounded(self, text):
+        """wrap_bounded(text : string | ChunkedText) -> ([string], float)
+
+        Like wrap(), but also return the smallest width above 'self.width'
+        at which the wrapped lines could differ (see _wrap_chunks_bounded()).
+        Useful for searching over many widths without wrapping at each one.
+        """
+        return self._wrap_chunks_bounded(*self._text_chunks(text))
+
+    def wrap_spans(self, text):
+        """wrap_spans(text : string | ChunkedText) -> ([(int, int)], float)
+
+        Like wrap_bounded(), but return each line as the (start, end)
+        indices of the chunks it joins instead of as a string, so callers
+        can map lines back onto the chunks of 'text' (eg. to carry styling
+        over).  Only plain greedy wrapping (no long word breaking, indents
+        or max_lines) is supported.
+        """
+        if not self._plain_greedy():
+            raise ValueError("wrap_spans() needs plain greedy wrapping")
+        if self.width <= 0:
+            raise ValueError("invalid width %r (must be > 0)" % self.width)
+        chunks, measured = self._text_chunks(text)
+        if measured is None:
+            widths = self._chunk_widths(chunks)
+            measured = (widths, list(accumulate(widths, initial=0)))
+        return self._greedy_spans(chunks, *measured, self.width)
+
+    def wrap_many(self, text, widths):
+        """wrap_many(text : string | ChunkedText, widths : [float])
+            -> [[string]]
+
+        Wrap 'text' at each of 'widths', as wrap() would with 'self.width'
+        set to each.  The text is split and, for plain greedy wrapping (no
+        long word breaking, indents or max_lines), measured only once.
+        """
+        chunks, measured = self._text_chunks(text)
+
+        if not self._plain_greedy():
+            results = []
+            for width in widths:
+                wrapper = copy.copy(self)
+                wrapper.width = width
+                results.append(wrapper._wrap_chunks(list(chunks)))
+            return results
+
+        if measured is None:
+            chunk_widths = self._chunk_widths(chunks)
+            measured = (chunk_widths, list(accumulate(chunk_widths, initial=0)))
+        chunk_widths, prefix = measured
+        results = []
+        for width in widths:
+            if width <= 0:
+                raise ValueError("invalid width %r (must be > 0)" % width)
+            results.append(
+                self._greedy_wrap(chunks, chunk_widths, prefix, width)[0])
+        return results
 
     def fill(self, text):
-        """fill(text : string) -> string
+        """fill(text : string | ChunkedText) -> string
 
         Reformat the single paragraph in 'text' to fit in lines of no
         more than 'self.width' columns, and return a new string
@@ -377,6 +614,17 @@ class TextWrapper:
 
 # -- Convenience interface ---------------------------------------------
 
+def tokenize(text, **kwargs):
+    """Split a single paragraph of text into a ChunkedText, to be wrapped
+    many times by wrap(), wrap_bounded() and friends with the same keyword
+    args.
+
+    Splitting does not depend on the canvas, font or width, so only the
+    keyword args that control whitespace and hyphen handling matter.
+    """
+    w = TextWrapper(None, None, None, width=1, **kwargs)
+    return w.tokenize(text)
+
 def wrap(text, canvas, font, font_size, width, **kwargs):
     """Wrap a single paragraph of text, returning a list of wrapped lines.
 
@@ -390,6 +638,25 @@ def wrap(text, canvas, font, font_size, width, **kwargs):
     w = TextWrapper(canvas, font, font_size, width=width, **kwargs)
     return w.wrap(text)
 
+def wrap_bounded(text, canvas, font, font_size, width, **kwargs):
+    """Wrap a single paragraph of text, returning the wrapped lines and the
+    smallest width above 'width' at which they could change.
+
+    See TextWrapper.wrap_bounded() for details.
+    """
+    w = TextWrapper(canvas, font, font_size, width=width, **kwargs)
+    return w.wrap_bounded(text)
+
+def wrap_many(text, canvas, font, font_size, widths, **kwargs):
+    """Wrap a single paragraph of text at each of several widths, returning
+    a list of wrapped lines per width.
+
+    See TextWrapper.wrap_many() for details.
+    """
+    w = TextWrapper(canvas, font, font_size, width=max(widths, default=1),
+                    **kwargs)
+    return w.wrap_many(text, widths)
+
 def fill(text, canvas, font, font_size, width, **kwargs):
     """Fill a single paragraph of text, returning a new string.
 